@@ -1,10 +1,17 @@
 import os
 import sys
-import io
+import multiprocessing
+import queue
 import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from PIL import Image
+
+from ImgCompress_control import BatchControl
+from ImgCompress_engine import format_eta, run_batch
+from ImgCompress_report import format_report
+
+UI_POLL_MS = 33       # Cada cuánto vacía la ventana la cola de eventos del hilo (~30 por segundo)
+LOG_MAX_LINES = 1000  # Líneas que conserva el log; las más antiguas se descartan
 
 class ImageCompressorApp(tk.Tk):
     def __init__(self):
@@ -33,6 +40,12 @@ class ImageCompressorApp(tk.Tk):
         # Variables de estado
         self.folder_path = None
         self.is_processing = False
+        self.control = None # BatchControl de la pasada en curso
+        self.worker = None
+        self.closing = False
+        # Único canal entre el hilo de compresión y Tk: el hilo solo encola y
+        # la ventana lo vacía desde su propio bucle (Tk no es seguro entre hilos)
+        self.events = queue.Queue()
 
         # --- INTERFAZ GRÁFICA (GUI) ---
         
@@ -68,7 +81,11 @@ class ImageCompressorApp(tk.Tk):
 
         # Barra de Progreso
         self.progress_bar = ttk.Progressbar(main_frame, orient="horizontal", length=450, mode="determinate", style="TProgressbar")
-        self.progress_bar.pack(pady=20)
+        self.progress_bar.pack(pady=(20, 0))
+
+        # Tiempo restante estimado
+        self.label_eta = tk.Label(main_frame, text="", bg=self.bg_color, fg="#aaaaaa")
+        self.label_eta.pack(pady=(5, 10))
 
         # Área de Texto (Log)
         self.textbox = tk.Text(main_frame, height=10, width=60, 
@@ -79,13 +96,33 @@ class ImageCompressorApp(tk.Tk):
         self.textbox.insert("1.0", "Esperando instrucciones...\n")
         self.textbox.configure(state="disabled")
 
-        # Botón de Iniciar
-        self.btn_start = tk.Button(main_frame, text="INICIAR PROCESO", 
+        # Botones de Iniciar / Pausar / Cancelar
+        buttons_frame = tk.Frame(main_frame, bg=self.bg_color)
+        buttons_frame.pack(pady=20)
+
+        self.btn_start = tk.Button(buttons_frame, text="INICIAR PROCESO", 
                                    command=self.start_thread, state="disabled", 
                                    font=("Helvetica", 13, "bold"),
                                    bg=self.accent_color, fg="white",
                                    highlightbackground=self.bg_color) # Parche Mac
-        self.btn_start.pack(pady=20, ipady=5, ipadx=20)
+        self.btn_start.pack(side="left", padx=5, ipady=5, ipadx=20)
+
+        self.btn_pause = tk.Button(buttons_frame, text="Pausar", 
+                                   command=self.toggle_pause, state="disabled", 
+                                   font=("Helvetica", 13),
+                                   highlightbackground=self.bg_color)
+        self.btn_pause.pack(side="left", padx=5, ipady=5, ipadx=10)
+
+        self.btn_cancel = tk.Button(buttons_frame, text="Cancelar", 
+                                    command=self.cancel_processing, state="disabled", 
+                                    font=("Helvetica", 13),
+                                    highlightbackground=self.bg_color)
+        self.btn_cancel.pack(side="left", padx=5, ipady=5, ipadx=10)
+
+        # Cerrar la ventana a mitad de proceso lo cancela antes de salir
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        self.drain_id = self.after(UI_POLL_MS, self.drain_events)
 
     # --- LÓGICA DE INTERFAZ ---
 
@@ -99,9 +136,52 @@ class ImageCompressorApp(tk.Tk):
             self.progress_bar["value"] = 0
 
     def log(self, message):
-        """Escribe en la caja de texto"""
+        """Añade una línea al log; se puede llamar desde cualquier hilo"""
+        self.events.put(("log", message))
+
+    def drain_events(self):
+        """Aplica de una vez lo encolado desde el último ciclo: un solo insert y solo el último progreso"""
+        lines = []
+        progress = None
+        finals = []
+        while True:
+            try:
+                kind, *data = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "log":
+                lines.append(data[0])
+            elif kind == "progress":
+                progress = data
+            elif kind == "start":
+                # Detenemos la animación indeterminada y preparamos la barra real (en %)
+                self.progress_bar.stop()
+                self.progress_bar["maximum"] = 100
+                self.progress_bar["value"] = 0
+            else:
+                finals.append((kind, data))
+
+        if lines:
+            self.append_log(lines)
+        if progress is not None:
+            percent, eta = progress
+            self.progress_bar["value"] = percent
+            self.label_eta.configure(text=f"Tiempo restante: {format_eta(eta)}")
+        for kind, data in finals:
+            if kind == "done":
+                self.finish_processing(*data)
+            elif kind == "fatal":
+                self.fail_processing(*data)
+
+        self.drain_id = self.after(UI_POLL_MS, self.drain_events)
+
+    def append_log(self, lines):
+        """Escribe un lote de líneas y recorta el log a las LOG_MAX_LINES más recientes"""
         self.textbox.configure(state="normal")
-        self.textbox.insert("end", message + "\n")
+        self.textbox.insert("end", "\n".join(lines) + "\n")
+        total = int(self.textbox.index("end-1c").split(".")[0]) - 1
+        if total > LOG_MAX_LINES:
+            self.textbox.delete("1.0", f"{total - LOG_MAX_LINES + 1}.0")
         self.textbox.see("end")
         self.textbox.configure(state="disabled")
 
@@ -112,113 +192,150 @@ class ImageCompressorApp(tk.Tk):
         self.is_processing = True
         self.btn_select.configure(state="disabled")
         self.btn_start.configure(state="disabled")
+        self.btn_pause.configure(state="normal", text="Pausar")
+        self.btn_cancel.configure(state="normal")
         self.progress_bar.start(10) # Animación de "pensando"
         
-        threading.Thread(target=self.run_optimization_logic).start()
+        self.control = BatchControl()
+        self.worker = threading.Thread(target=self.run_optimization_logic)
+        self.worker.start()
+
+    def toggle_pause(self):
+        if self.control is None:
+            return
+        if self.control.paused:
+            self.control.resume()
+            self.btn_pause.configure(text="Pausar")
+            self.log("Reanudado")
+        else:
+            self.control.pause()
+            self.btn_pause.configure(text="Reanudar")
+            self.log("En pausa")
+
+    def cancel_processing(self):
+        if self.control is None:
+            return
+        self.control.cancel()
+        self.btn_pause.configure(state="disabled")
+        self.btn_cancel.configure(state="disabled")
+        self.log("Cancelando...")
 
-    # --- MOTOR DE COMPRESIÓN (Idéntico al anterior) ---
+    def on_close(self):
+        if self.worker is not None and self.worker.is_alive():
+            # Lo ya optimizado queda en el manifiesto: la próxima vez se continúa desde ahí.
+            # No se espera con join(): el hilo aún escribe en la ventana hasta terminar
+            if not self.closing:
+                self.closing = True
+                self.cancel_processing()
+            self.after(100, self.on_close)
+            return
+        self.after_cancel(self.drain_id)
+        self.destroy()
+
+    # --- MOTOR DE COMPRESIÓN (compartido: ImgCompress_engine) ---
     def run_optimization_logic(self):
         try:
             limite_mb = 16
-            limite_bytes = limite_mb * 1024 * 1024
             carpeta_origen = self.folder_path
             
             nombre_carpeta_destino = "Listas_WhatsApp"
             carpeta_salida = os.path.join(carpeta_origen, nombre_carpeta_destino)
-            ext_validas = ('.png', '.jpg', '.jpeg', '.webp', '.tiff', '.bmp')
-
-            if not os.path.exists(carpeta_salida):
-                os.makedirs(carpeta_salida)
 
             self.log(f"\n--- Iniciando Análisis ---")
             
-            archivos = [f for f in os.listdir(carpeta_origen) 
-                        if f.lower().endswith(ext_validas) and os.path.isfile(os.path.join(carpeta_origen, f))]
-
-            if not archivos:
-                self.log("No se encontraron imágenes en la carpeta.")
-            
             count = 0
-            
-            # Detenemos la animación indeterminada y preparamos la barra real
-            self.progress_bar.stop()
-            self.progress_bar["maximum"] = len(archivos)
-            self.progress_bar["value"] = 0
+            cancelado = False
+
+            # Las imágenes se reparten entre los núcleos; los resultados llegan según terminan
+            # Sin deduplicar: la GUI escribe siempre un archivo por original, nunca enlaces duros
+            for evento in run_batch(carpeta_origen, limite_mb, carpeta_salida, "_whatsapp", control=self.control,
+                                    dedup="off"):
+                if evento["type"] == "start":
+                    self.events.put(("start",))
 
-            for i, archivo in enumerate(archivos):
-                # Actualizar barra de progreso
-                self.progress_bar["value"] = i + 1
-                
-                ruta_completa = os.path.join(carpeta_origen, archivo)
-                try:
-                    tamano_actual = os.path.getsize(ruta_completa)
-                    
-                    if tamano_actual > limite_bytes:
-                        self.log(f"Procesando: {archivo} ({tamano_actual/(1024*1024):.2f} MB)...")
-                        
-                        with Image.open(ruta_completa) as img:
-                            if img.mode in ("RGBA", "P"):
-                                img = img.convert("RGB")
-                            
-                            calidad = 95
-                            factor_escala = 1.0
-                            buffer = io.BytesIO()
-                            
-                            while True:
-                                buffer.seek(0)
-                                buffer.truncate(0)
-                                
-                                if calidad < 70:
-                                    factor_escala *= 0.9
-                                    nuevo_w = int(img.width * factor_escala)
-                                    nuevo_h = int(img.height * factor_escala)
-                                    img_temp = img.resize((nuevo_w, nuevo_h), Image.Resampling.LANCZOS)
-                                else:
-                                    img_temp = img
-
-                                img_temp.save(buffer, format="JPEG", quality=calidad, optimize=True)
-                                tamano_nuevo = buffer.tell()
-                                
-                                if tamano_nuevo <= limite_bytes:
-                                    nombre_nuevo = f"{os.path.splitext(archivo)[0]}_whatsapp.jpg"
-                                    ruta_final = os.path.join(carpeta_salida, nombre_nuevo)
-                                    
-                                    with open(ruta_final, "wb") as f:
-                                        f.write(buffer.getbuffer())
-                                    
-                                    self.log(f" -> OK: {tamano_nuevo/(1024*1024):.2f} MB")
-                                    count += 1
-                                    break
-                                
-                                calidad -= 5
-                                if calidad < 10 and factor_escala < 0.1:
-                                    self.log(f" -> Error: Imposible reducir {archivo}")
-                                    break
+                elif evento["type"] == "scan_done":
+                    if not evento["total"]:
+                        self.log("No se encontraron imágenes en la carpeta.")
                     else:
-                        pass
+                        self.log(f"{evento['jobs']} de {evento['total']} imágenes a optimizar ({evento['megapixels']:.0f} MP)")
 
-                except Exception as e:
-                    self.log(f"Error con {archivo}: {e}")
+                elif evento["type"] == "error":
+                    self.log(f"Error con {os.path.basename(evento['src'])}: {evento['error']}")
 
-            self.log("\n--- PROCESO TERMINADO ---")
+                elif evento["type"] == "cached":
+                    self.update_progress(evento)
+                    self.log(f"Ya optimizada: {os.path.basename(evento['result'].src)}")
+
+                elif evento["type"] == "file":
+                    # Actualizar barra de progreso (ponderada por megapíxeles)
+                    self.update_progress(evento)
+
+                    resultado = evento["result"]
+                    archivo = os.path.basename(resultado.src)
+                    self.log(f"Procesando: {archivo} ({resultado.original_size/(1024*1024):.2f} MB)...")
+                    if resultado.ok:
+                        self.log(f" -> OK: {resultado.size/(1024*1024):.2f} MB "
+                                 f"({resultado.attempts} intentos, {resultado.wall_s:.1f} s)")
+                        count += 1
+                    elif resultado.error:
+                        self.log(f"Error con {archivo}: {resultado.error}")
+                    else:
+                        self.log(f" -> Error: Imposible reducir {archivo}")
+
+                elif evento["type"] == "end":
+                    cancelado = evento["cancelled"]
+                    informe = format_report(evento["report"])
+                    if informe:
+                        self.log("\n--- Informe de tiempos ---")
+                        for linea in informe:
+                            self.log(linea)
+
+            self.log("\n--- PROCESO CANCELADO ---" if cancelado else "\n--- PROCESO TERMINADO ---")
             self.log(f"Total optimizadas: {count}")
             
-            self.finish_processing(count, carpeta_salida)
+            self.events.put(("done", count, carpeta_salida, cancelado))
 
         except Exception as e:
             self.log(f"ERROR CRÍTICO: {e}")
-            messagebox.showerror("Error", str(e))
-            self.progress_bar.stop()
+            self.events.put(("fatal", str(e)))
 
-    def finish_processing(self, count, carpeta_salida):
-        self.progress_bar["value"] = self.progress_bar["maximum"]
+    def update_progress(self, evento):
+        # Desde el hilo: la ventana solo pinta el último de cada ciclo
+        self.events.put(("progress", evento["percent"], evento["eta"]))
+
+    def fail_processing(self, error):
+        self.progress_bar.stop()
+        self.label_eta.configure(text="")
         self.btn_select.configure(state="normal")
-        # El botón de inicio queda desactivado hasta que seleccionen otra carpeta para evitar errores
+        self.btn_pause.configure(state="disabled", text="Pausar")
+        self.btn_cancel.configure(state="disabled")
         self.is_processing = False
+        if not self.closing:
+            messagebox.showerror("Error", error)
+
+    def finish_processing(self, count, carpeta_salida, cancelado=False):
+        self.label_eta.configure(text="")
+        self.btn_select.configure(state="normal")
+        self.btn_pause.configure(state="disabled", text="Pausar")
+        self.btn_cancel.configure(state="disabled")
+        self.is_processing = False
+        if self.closing:
+            return
+
+        if cancelado:
+            # Se puede relanzar la misma carpeta: continúa donde se quedó
+            self.btn_start.configure(state="normal")
+            messagebox.showinfo("Cancelado", f"Proceso cancelado.\nSe crearon {count} imágenes nuevas.\n"
+                                             "Vuelve a iniciarlo para continuar.")
+            return
+
+        self.progress_bar["value"] = self.progress_bar["maximum"]
+        # El botón de inicio queda desactivado hasta que seleccionen otra carpeta para evitar errores
         
         messagebox.showinfo("Éxito", f"Proceso finalizado.\nSe crearon {count} imágenes nuevas.")
         os.system(f'open "{carpeta_salida}"')
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # Necesario para el pool en la app empaquetada
     app = ImageCompressorApp()
     app.mainloop()
\ No newline at end of file
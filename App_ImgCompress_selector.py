@@ -1,117 +1,195 @@
 import sys
 import os
-import io
-from PIL import Image
+import multiprocessing
+import threading
+
+from ImgCompress_control import BatchControl
+from ImgCompress_engine import DEFAULT_OUTPUT_NAME, format_eta, run_batch
+from ImgCompress_report import format_report
 
 # Importamos los componentes de PyQt6
 from PyQt6.QtWidgets import (QApplication, QWidget, QVBoxLayout, QLabel, 
                              QPushButton, QFileDialog, QSlider, QProgressBar, 
-                             QTextEdit, QMessageBox, QHBoxLayout, QFrame)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
+                             QPlainTextEdit, QMessageBox, QHBoxLayout, QFrame, QTableView, QHeaderView)
+from PyQt6.QtCore import Qt, QThread, pyqtSignal, QTimer, QAbstractTableModel, QModelIndex
 from PyQt6.QtGui import QFont, QIcon, QPalette, QColor
 
+UI_UPDATE_MS = 33        # La ventana recoge lo pendiente del hilo como mucho ~30 veces por segundo
+LOG_MAX_LINES = 1000     # Líneas que conserva el log (las más antiguas se descartan)
+RESULT_MAX_ROWS = 10000  # Filas que conserva la tabla de resultados
+
 # --- CLASE TRABAJADOR (Hilo en segundo plano) ---
 class Worker(QThread):
-    progress = pyqtSignal(int)
-    log = pyqtSignal(str)
-    finished = pyqtSignal(int, str) # count, path
-
-    def __init__(self, folder_path, target_mb):
+    """
+    Comprime en segundo plano. En vez de una señal por mensaje, acumula log,
+    filas de resultados y el último progreso, y la ventana los recoge de golpe
+    con take() en cada tic de su QTimer.
+    """
+    finished = pyqtSignal(int, str, bool) # count, path, cancelled
+
+    def __init__(self, folder_path, target_mb, workers=None):
         super().__init__()
         self.folder_path = folder_path
         self.target_mb = target_mb
-        self.is_running = True
+        self.workers = workers # None = un proceso por núcleo
+        self.control = BatchControl() # Pausa / cancelación desde la ventana
+        self.lock = threading.Lock()
+        self.lines = []
+        self.rows = []
+        self.progress = None # (porcentaje, eta) más reciente
+
+    def log(self, msg):
+        with self.lock:
+            self.lines.append(msg)
+
+    def add_row(self, result, status):
+        row = (os.path.basename(result.src), f"{result.original_size/1024/1024:.1f} MB",
+               f"{result.size/1024/1024:.1f} MB" if result.size else "-", result.codec.upper(), status)
+        with self.lock:
+            self.rows.append(row)
+
+    def set_progress(self, percent, eta):
+        with self.lock:
+            self.progress = (percent, eta)
+
+    def take(self):
+        """Devuelve y vacía lo pendiente: (líneas, filas, progreso o None)"""
+        with self.lock:
+            pending = (self.lines, self.rows, self.progress)
+            self.lines, self.rows, self.progress = [], [], None
+        return pending
 
     def run(self):
         try:
-            limit_bytes = self.target_mb * 1024 * 1024
-            output_folder = os.path.join(self.folder_path, "X-TREME_COMPRESSED")
-            
-            if not os.path.exists(output_folder):
-                os.makedirs(output_folder)
-            
-            exts = ('.png', '.jpg', '.jpeg', '.webp', '.tiff', '.bmp')
-            files = [f for f in os.listdir(self.folder_path) 
-                     if f.lower().endswith(exts) and os.path.isfile(os.path.join(self.folder_path, f))]
-
-            if not files:
-                self.log.emit(">> NO FILES FOUND.")
-                self.finished.emit(0, output_folder)
-                return
-
-            self.log.emit(f">> SYSTEM READY. TARGET: {self.target_mb} MB")
-            self.log.emit(f">> INITIALIZING ALGORITHM...")
-            
+            output_folder = os.path.join(self.folder_path, DEFAULT_OUTPUT_NAME)
             count = 0
-            total = len(files)
-
-            for i, f in enumerate(files):
-                if not self.is_running: break
-                
-                # Reportar progreso
-                self.progress.emit(int(((i + 1) / total) * 100))
-                
-                full_path = os.path.join(self.folder_path, f)
-                try:
-                    size = os.path.getsize(full_path)
-                    if size > limit_bytes:
-                        self.log.emit(f"PROCESSING: {f} ({size/1024/1024:.1f} MB)")
-                        
-                        with Image.open(full_path) as img:
-                            if img.mode in ("RGBA", "P"): img = img.convert("RGB")
-                            
-                            qual = 95
-                            scale = 1.0
-                            buf = io.BytesIO()
-                            
-                            while True:
-                                buf.seek(0); buf.truncate(0)
-                                if qual < 70:
-                                    scale *= 0.9
-                                    w, h = int(img.width * scale), int(img.height * scale)
-                                    img_temp = img.resize((w, h), Image.Resampling.LANCZOS)
-                                else:
-                                    img_temp = img
-                                
-                                img_temp.save(buf, "JPEG", quality=qual, optimize=True)
-                                
-                                if buf.tell() <= limit_bytes:
-                                    out_name = f"{os.path.splitext(f)[0]}_XTREME.jpg"
-                                    with open(os.path.join(output_folder, out_name), "wb") as outfile:
-                                        outfile.write(buf.getbuffer())
-                                    self.log.emit(f" [OK] REDUCED TO: {buf.tell()/1024/1024:.1f} MB")
-                                    count += 1
-                                    break
-                                
-                                qual -= 5
-                                if qual < 10 and scale < 0.1:
-                                    self.log.emit(f" [FAIL] COULD NOT COMPRESS: {f}")
-                                    break
+            cancelled = False
+
+            # Cada imagen se comprime en un proceso del pool; los eventos llegan según terminan
+            # Al cancelar, run_batch corta lo que está en curso y termina con su evento end
+            # Sin deduplicar: la GUI escribe siempre un archivo por original, nunca enlaces duros
+            for event in run_batch(self.folder_path, self.target_mb, output_folder, workers=self.workers,
+                                   control=self.control, dedup="off"):
+                if event["type"] == "start":
+                    self.log(f">> SYSTEM READY. TARGET: {self.target_mb} MB")
+                    self.log(f">> INITIALIZING ALGORITHM...")
+
+                elif event["type"] == "scan_done":
+                    if not event["total"]:
+                        self.log(">> NO FILES FOUND.")
                     else:
-                        pass # Ya es pequeña
-                except Exception as e:
-                    self.log.emit(f" [ERROR] {f}: {e}")
+                        self.log(f">> SCAN COMPLETE: {event['total']} FILES, {event['jobs']} TO COMPRESS "
+                                 f"({event['megapixels']:.0f} MP)")
+
+                elif event["type"] == "end":
+                    cancelled = event["cancelled"]
+                    if not cancelled:
+                        self.set_progress(100, 0)
+                    report = format_report(event["report"])
+                    if report:
+                        self.log(">> RUN REPORT:")
+                        for line in report:
+                            self.log(f"   {line}")
+
+                elif event["type"] == "error":
+                    self.log(f" [ERROR] {os.path.basename(event['src'])}: {event['error']}")
+
+                elif event["type"] == "cached":
+                    self.set_progress(event["percent"], event["eta"])
+                    self.add_row(event["result"], "SKIP")
+
+                elif event["type"] == "file":
+                    self.set_progress(event["percent"], event["eta"])
+
+                    # Una fila por imagen; el log queda para los mensajes del sistema
+                    result = event["result"]
+                    if result.ok:
+                        self.add_row(result, f"OK ({result.attempts} ENC, {result.wall_s:.1f}s)")
+                        count += 1
+                    elif result.error:
+                        self.add_row(result, f"ERROR: {result.error}")
+                    else:
+                        self.add_row(result, "FAIL")
 
-            self.finished.emit(count, output_folder)
+            self.finished.emit(count, output_folder, cancelled)
 
         except Exception as e:
-            self.log.emit(f"CRITICAL ERROR: {str(e)}")
-            self.finished.emit(0, "")
+            self.log(f"CRITICAL ERROR: {str(e)}")
+            self.finished.emit(0, "", False)
 
     def stop(self):
-        self.is_running = False
+        self.control.cancel()
+
+    def pause(self):
+        self.control.pause()
+
+    def resume(self):
+        self.control.resume()
+
+class ResultModel(QAbstractTableModel):
+    """Una fila por imagen; QTableView solo pinta las visibles aunque haya miles"""
+
+    def __init__(self, headers):
+        super().__init__()
+        self.headers = headers
+        self.rows = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.rows[index.row()][index.column()]
+        if role == Qt.ItemDataRole.TextAlignmentRole and index.column() in (1, 2):
+            return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.headers[section]
+        return None
+
+    def set_headers(self, headers):
+        self.headers = headers
+        self.headerDataChanged.emit(Qt.Orientation.Horizontal, 0, len(headers) - 1)
+
+    def add_rows(self, rows):
+        """Añade un lote de filas y descarta las más antiguas por encima de RESULT_MAX_ROWS"""
+        rows = rows[-RESULT_MAX_ROWS:]
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self.rows.extend(rows)
+        self.endInsertRows()
+        excess = len(self.rows) - RESULT_MAX_ROWS
+        if excess > 0:
+            self.beginRemoveRows(QModelIndex(), 0, excess - 1)
+            del self.rows[:excess]
+            self.endRemoveRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.rows = []
+        self.endResetModel()
 
 # --- VENTANA PRINCIPAL ---
 class CompressorApp(QWidget):
     def __init__(self):
         super().__init__()
         self.folder_path = None
+        self.worker = None
+        # Recoge lo acumulado por el Worker mientras hay un proceso en marcha
+        self.ui_timer = QTimer(self)
+        self.ui_timer.setInterval(UI_UPDATE_MS)
+        self.ui_timer.timeout.connect(self.drain_worker)
         self.init_ui()
 
     def init_ui(self):
         # NOMBRE ESTILO KEYGEN
         self.setWindowTitle("HYPER-SHRINK 3000 [Unregistered]") 
-        self.setGeometry(100, 100, 520, 680)
+        self.setGeometry(100, 100, 560, 820)
         
         # --- ESTILO VISUAL "KEYGEN 2000s" ---
         # Fondo negro, letras verde matrix/neón, fuente monoespaciada
@@ -145,7 +223,18 @@ class CompressorApp(QWidget):
             QProgressBar::chunk { 
                 background-color: #00FF00; 
             }
-            QTextEdit { 
+            QTableView {
+                background-color: #050505;
+                border: 1px dashed #00FF00;
+                color: #00FF00;
+                gridline-color: #004400;
+            }
+            QHeaderView::section {
+                background-color: #000000;
+                color: #00FF00;
+                border: 1px solid #004400;
+            }
+            QPlainTextEdit { 
                 background-color: #050505; 
                 border: 1px dashed #00FF00; 
                 color: #00FF00;
@@ -234,11 +323,25 @@ class CompressorApp(QWidget):
         layout.addWidget(self.pbar)
 
         # Log
-        self.log_box = QTextEdit()
+        self.log_box = QPlainTextEdit()
         self.log_box.setReadOnly(True)
-        self.log_box.setText(">> WAITING FOR USER INPUT...")
+        self.log_box.setMaximumBlockCount(LOG_MAX_LINES)
+        self.log_box.setPlainText(">> WAITING FOR USER INPUT...")
         layout.addWidget(self.log_box)
 
+        # Resultados por imagen
+        self.results = ResultModel(["FILE", "ORIGINAL", "RESULT", "FORMAT", "STATUS"])
+        self.results_view = QTableView()
+        self.results_view.setModel(self.results)
+        self.results_view.verticalHeader().hide()
+        self.results_view.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.results_view.verticalHeader().setDefaultSectionSize(20)
+        self.results_view.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        self.results_view.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.results_view.horizontalHeader().setStretchLastSection(True)
+        self.results_view.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
+        layout.addWidget(self.results_view)
+
         # Botón Inicio
         self.btn_start = QPushButton(">> EXECUTE <<")
         self.btn_start.setCursor(Qt.CursorShape.PointingHandCursor)
@@ -246,6 +349,21 @@ class CompressorApp(QWidget):
         self.btn_start.clicked.connect(self.start_process)
         layout.addWidget(self.btn_start)
 
+        # Pausa / cancelación (solo activos durante el proceso)
+        control_layout = QHBoxLayout()
+        self.btn_pause = QPushButton("[ PAUSE ]")
+        self.btn_pause.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.btn_pause.setEnabled(False)
+        self.btn_pause.clicked.connect(self.toggle_pause)
+        control_layout.addWidget(self.btn_pause)
+
+        self.btn_abort = QPushButton("[ ABORT ]")
+        self.btn_abort.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.btn_abort.setEnabled(False)
+        self.btn_abort.clicked.connect(self.abort_process)
+        control_layout.addWidget(self.btn_abort)
+        layout.addLayout(control_layout)
+
         self.setLayout(layout)
 
     def select_folder(self):
@@ -257,12 +375,30 @@ class CompressorApp(QWidget):
             self.log_msg(f">> TARGET MOUNTED: {folder}")
             self.btn_start.setEnabled(True)
             self.pbar.setValue(0)
+            self.pbar.setFormat("%p%")
 
     def update_slider(self, value):
         self.lbl_slider_val.setText(f"{value} MB")
 
     def log_msg(self, msg):
-        self.log_box.append(msg)
+        self.log_box.appendPlainText(msg)
+
+    def drain_worker(self):
+        """Pinta de una vez lo acumulado por el Worker desde el último tic"""
+        if self.worker is None: return
+        lines, rows, progress = self.worker.take()
+        if lines:
+            self.log_box.appendPlainText("\n".join(lines))
+        if rows:
+            scrollbar = self.results_view.verticalScrollBar()
+            at_bottom = scrollbar.value() == scrollbar.maximum()
+            self.results.add_rows(rows)
+            if at_bottom: # No arrastrar al usuario si está revisando filas anteriores
+                self.results_view.scrollToBottom()
+        if progress is not None:
+            percent, eta = progress
+            self.update_progress(int(percent))
+            self.update_eta(format_eta(eta))
 
     def start_process(self):
         if not self.folder_path: return
@@ -275,19 +411,59 @@ class CompressorApp(QWidget):
 
         # Iniciar hilo
         self.worker = Worker(self.folder_path, self.slider.value())
-        self.worker.progress.connect(self.update_progress)
-        self.worker.log.connect(self.log_msg)
         self.worker.finished.connect(self.process_finished)
+        self.results.clear()
         self.worker.start()
+        self.ui_timer.start()
+        self.btn_pause.setEnabled(True)
+        self.btn_abort.setEnabled(True)
+
+    def toggle_pause(self):
+        if self.worker is None: return
+        if self.worker.control.paused:
+            self.worker.resume()
+            self.btn_pause.setText("[ PAUSE ]")
+            self.log_msg(">> RESUMED")
+        else:
+            self.worker.pause()
+            self.btn_pause.setText("[ RESUME ]")
+            self.log_msg(">> PAUSED")
+
+    def abort_process(self):
+        if self.worker is None: return
+        self.worker.stop()
+        self.btn_pause.setEnabled(False)
+        self.btn_abort.setEnabled(False)
+        self.log_msg(">> ABORTING...")
+
+    def closeEvent(self, event):
+        # Cerrar la ventana cancela la pasada; lo ya comprimido queda en el manifiesto
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.stop()
+            self.worker.wait()
+        super().closeEvent(event)
 
     def update_progress(self, val):
         self.pbar.setValue(val)
 
-    def process_finished(self, count, out_folder):
+    def update_eta(self, eta):
+        self.pbar.setFormat(f"%p%  ETA {eta}")
+
+    def process_finished(self, count, out_folder, cancelled):
+        self.ui_timer.stop()
+        self.drain_worker() # Lo último que quedó pendiente
         self.btn_select.setEnabled(True)
         self.btn_start.setEnabled(True)
         self.slider.setEnabled(True)
+        self.btn_pause.setEnabled(False)
+        self.btn_abort.setEnabled(False)
+        self.btn_pause.setText("[ PAUSE ]")
         
+        if cancelled:
+            self.log_msg(f"\n>> JOB ABORTED. {count} FILES PROCESSED. EXECUTE AGAIN TO RESUME.")
+            QMessageBox.information(self, "ABORTED", f"OPERATION ABORTED.\nPROCESSED: {count}")
+            return
+
         self.log_msg(f"\n>> JOB DONE. {count} FILES PROCESSED.")
         QMessageBox.information(self, "SUCCESS", f"OPERATION COMPLETED.\nPROCESSED: {count}")
         
@@ -297,6 +473,7 @@ class CompressorApp(QWidget):
             os.startfile(out_folder)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # Necesario para el pool en la app empaquetada
     app = QApplication(sys.argv)
     window = CompressorApp()
     window.show()
@@ -1,116 +1,222 @@
+import time
+_T_START = time.perf_counter() # Referencia de --startup-time: antes de cualquier import pesado
+
 import sys
 import os
-import io
+import multiprocessing
+import threading
 import random  # Necesario para el efecto Matrix/Glitch
-from PIL import Image
+
+# El motor (y con él Pillow) no se importa aquí: lo carga el Worker al empezar a comprimir
+from ImgCompress_control import BatchControl
+from ImgCompress_report import format_report
 
 # Importamos los componentes de PyQt6
 from PyQt6.QtWidgets import (QApplication, QWidget, QVBoxLayout, QLabel, 
                              QPushButton, QFileDialog, QSlider, QProgressBar, 
-                             QTextEdit, QMessageBox, QHBoxLayout, QFrame, QComboBox)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QUrl, QTimer # Agregamos QTimer
+                             QPlainTextEdit, QMessageBox, QHBoxLayout, QFrame, QTableView, QHeaderView, QComboBox)
+from PyQt6.QtCore import (Qt, QThread, pyqtSignal, QUrl, QTimer, # Agregamos QTimer
+                          QAbstractTableModel, QModelIndex, QEvent)
 from PyQt6.QtGui import QFont, QIcon, QPalette, QColor
 
-# Módulo Multimedia para el Chiptune
-from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
+# QtMultimedia (el chiptune) tampoco: se carga tras el primer pintado y solo con el tema keygen
+
+_T_IMPORTS = time.perf_counter()
+STARTUP_TIME_FLAG = "--startup-time" # Mide el arranque hasta el primer pintado y sale
+
+UI_UPDATE_MS = 33        # La ventana recoge lo pendiente del hilo como mucho ~30 veces por segundo
+LOG_MAX_LINES = 1000     # Líneas que conserva el log (las más antiguas se descartan)
+RESULT_MAX_ROWS = 10000  # Filas que conserva la tabla de resultados
+
+# Animación del logo (tema keygen)
+GLITCH_FRAMES = 64       # Fotogramas precalculados que se repiten en bucle
+GLITCH_RATE = 0.15       # Probabilidad de que un carácter salga "glitcheado"
+ANIM_FPS_OPTIONS = {"OFF": 0, "6 FPS": 6, "12 FPS": 12, "25 FPS": 25}
+DEFAULT_ANIM_FPS = "12 FPS"
+
+
+def make_glitch_frames(text, chars, count=GLITCH_FRAMES, rate=GLITCH_RATE, seed=3000):
+    """Genera de una vez los fotogramas del efecto glitch/matrix sobre TODO el bloque de texto"""
+    rng = random.Random(seed)
+    frames = []
+    for _ in range(count):
+        # Cualquier carácter (letras o espacios) puede glitchear; los saltos de línea se respetan
+        frames.append("".join(rng.choice(chars) if char != "\n" and rng.random() < rate else char
+                              for char in text))
+    return frames
 
 # --- CLASE TRABAJADOR (Hilo en segundo plano) ---
 class Worker(QThread):
-    progress = pyqtSignal(int)
-    log = pyqtSignal(str)
-    finished = pyqtSignal(int, str) # count, path
-
-    def __init__(self, folder_path, target_mb):
+    """
+    Comprime en segundo plano. En vez de una señal por mensaje, acumula log,
+    filas de resultados y el último progreso, y la ventana los recoge de golpe
+    con take() en cada tic de su QTimer.
+    """
+    finished = pyqtSignal(int, str, bool) # count, path, cancelled
+
+    def __init__(self, folder_path, target_mb, workers=None):
         super().__init__()
         self.folder_path = folder_path
         self.target_mb = target_mb
-        self.is_running = True
+        self.workers = workers # None = un proceso por núcleo
+        self.control = BatchControl() # Pausa / cancelación desde la ventana
+        self.lock = threading.Lock()
+        self.lines = []
+        self.rows = []
+        self.progress = None # (porcentaje, eta) más reciente
+
+    def log(self, msg):
+        with self.lock:
+            self.lines.append(msg)
+
+    def add_row(self, result, status):
+        row = (os.path.basename(result.src), f"{result.original_size/1024/1024:.1f} MB",
+               f"{result.size/1024/1024:.1f} MB" if result.size else "-", result.codec.upper(), status)
+        with self.lock:
+            self.rows.append(row)
+
+    def set_progress(self, percent, eta): # eta ya formateado
+        with self.lock:
+            self.progress = (percent, eta)
+
+    def take(self):
+        """Devuelve y vacía lo pendiente: (líneas, filas, progreso o None)"""
+        with self.lock:
+            pending = (self.lines, self.rows, self.progress)
+            self.lines, self.rows, self.progress = [], [], None
+        return pending
 
     def run(self):
         try:
-            limit_bytes = self.target_mb * 1024 * 1024
-            output_folder = os.path.join(self.folder_path, "X-TREME_COMPRESSED")
-            
-            if not os.path.exists(output_folder):
-                os.makedirs(output_folder)
-            
-            exts = ('.png', '.jpg', '.jpeg', '.webp', '.tiff', '.bmp')
-            files = [f for f in os.listdir(self.folder_path) 
-                     if f.lower().endswith(exts) and os.path.isfile(os.path.join(self.folder_path, f))]
+            from ImgCompress_engine import DEFAULT_OUTPUT_NAME, format_eta, run_batch
 
-            if not files:
-                self.log.emit(">> NO FILES FOUND.")
-                self.finished.emit(0, output_folder)
-                return
-
-            self.log.emit(f">> SYSTEM READY. TARGET: {self.target_mb} MB")
-            self.log.emit(f">> INITIALIZING ALGORITHM...")
-            
+            output_folder = os.path.join(self.folder_path, DEFAULT_OUTPUT_NAME)
             count = 0
-            total = len(files)
-
-            for i, f in enumerate(files):
-                if not self.is_running: break
-                
-                # Reportar progreso
-                self.progress.emit(int(((i + 1) / total) * 100))
-                
-                full_path = os.path.join(self.folder_path, f)
-                try:
-                    size = os.path.getsize(full_path)
-                    if size > limit_bytes:
-                        self.log.emit(f"PROCESSING: {f} ({size/1024/1024:.1f} MB)")
-                        
-                        with Image.open(full_path) as img:
-                            if img.mode in ("RGBA", "P"): img = img.convert("RGB")
-                            
-                            qual = 95
-                            scale = 1.0
-                            buf = io.BytesIO()
-                            
-                            while True:
-                                buf.seek(0); buf.truncate(0)
-                                if qual < 70:
-                                    scale *= 0.9
-                                    w, h = int(img.width * scale), int(img.height * scale)
-                                    img_temp = img.resize((w, h), Image.Resampling.LANCZOS)
-                                else:
-                                    img_temp = img
-                                
-                                img_temp.save(buf, "JPEG", quality=qual, optimize=True)
-                                
-                                if buf.tell() <= limit_bytes:
-                                    out_name = f"{os.path.splitext(f)[0]}_XTREME.jpg"
-                                    with open(os.path.join(output_folder, out_name), "wb") as outfile:
-                                        outfile.write(buf.getbuffer())
-                                    self.log.emit(f" [OK] REDUCED TO: {buf.tell()/1024/1024:.1f} MB")
-                                    count += 1
-                                    break
-                                
-                                qual -= 5
-                                if qual < 10 and scale < 0.1:
-                                    self.log.emit(f" [FAIL] COULD NOT COMPRESS: {f}")
-                                    break
+            cancelled = False
+
+            # Cada imagen se comprime en un proceso del pool; los eventos llegan según terminan
+            # Al cancelar, run_batch corta lo que está en curso y termina con su evento end
+            # Sin deduplicar: la GUI escribe siempre un archivo por original, nunca enlaces duros
+            for event in run_batch(self.folder_path, self.target_mb, output_folder, workers=self.workers,
+                                   control=self.control, dedup="off"):
+                if event["type"] == "start":
+                    self.log(f">> SYSTEM READY. TARGET: {self.target_mb} MB")
+                    self.log(f">> INITIALIZING ALGORITHM...")
+
+                elif event["type"] == "scan_done":
+                    if not event["total"]:
+                        self.log(">> NO FILES FOUND.")
+                    else:
+                        self.log(f">> SCAN COMPLETE: {event['total']} FILES, {event['jobs']} TO COMPRESS "
+                                 f"({event['megapixels']:.0f} MP)")
+
+                elif event["type"] == "end":
+                    cancelled = event["cancelled"]
+                    if not cancelled:
+                        self.set_progress(100, format_eta(0))
+                    report = format_report(event["report"])
+                    if report:
+                        self.log(">> RUN REPORT:")
+                        for line in report:
+                            self.log(f"   {line}")
+
+                elif event["type"] == "error":
+                    self.log(f" [ERROR] {os.path.basename(event['src'])}: {event['error']}")
+
+                elif event["type"] == "cached":
+                    self.set_progress(event["percent"], format_eta(event["eta"]))
+                    self.add_row(event["result"], "SKIP")
+
+                elif event["type"] == "file":
+                    self.set_progress(event["percent"], format_eta(event["eta"]))
+
+                    # Una fila por imagen; el log queda para los mensajes del sistema
+                    result = event["result"]
+                    if result.ok:
+                        self.add_row(result, f"OK ({result.attempts} ENC, {result.wall_s:.1f}s)")
+                        count += 1
+                    elif result.error:
+                        self.add_row(result, f"ERROR: {result.error}")
                     else:
-                        pass # Ya es pequeña
-                except Exception as e:
-                    self.log.emit(f" [ERROR] {f}: {e}")
+                        self.add_row(result, "FAIL")
 
-            self.finished.emit(count, output_folder)
+            self.finished.emit(count, output_folder, cancelled)
 
         except Exception as e:
-            self.log.emit(f"CRITICAL ERROR: {str(e)}")
-            self.finished.emit(0, "")
+            self.log(f"CRITICAL ERROR: {str(e)}")
+            self.finished.emit(0, "", False)
 
     def stop(self):
-        self.is_running = False
+        self.control.cancel()
+
+    def pause(self):
+        self.control.pause()
+
+    def resume(self):
+        self.control.resume()
+
+class ResultModel(QAbstractTableModel):
+    """Una fila por imagen; QTableView solo pinta las visibles aunque haya miles"""
+
+    def __init__(self, headers):
+        super().__init__()
+        self.headers = headers
+        self.rows = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.rows[index.row()][index.column()]
+        if role == Qt.ItemDataRole.TextAlignmentRole and index.column() in (1, 2):
+            return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.headers[section]
+        return None
+
+    def set_headers(self, headers):
+        self.headers = headers
+        self.headerDataChanged.emit(Qt.Orientation.Horizontal, 0, len(headers) - 1)
+
+    def add_rows(self, rows):
+        """Añade un lote de filas y descarta las más antiguas por encima de RESULT_MAX_ROWS"""
+        rows = rows[-RESULT_MAX_ROWS:]
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self.rows.extend(rows)
+        self.endInsertRows()
+        excess = len(self.rows) - RESULT_MAX_ROWS
+        if excess > 0:
+            self.beginRemoveRows(QModelIndex(), 0, excess - 1)
+            del self.rows[:excess]
+            self.endRemoveRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.rows = []
+        self.endResetModel()
 
 # --- VENTANA PRINCIPAL ---
 class CompressorApp(QWidget):
     def __init__(self):
         super().__init__()
         self.folder_path = None
+        self.worker = None
+        # Recoge lo acumulado por el Worker mientras hay un proceso en marcha
+        self.ui_timer = QTimer(self)
+        self.ui_timer.setInterval(UI_UPDATE_MS)
+        self.ui_timer.timeout.connect(self.drain_worker)
         self.has_audio = False
+        self.audio_checked = False # init_audio ya se intentó (haya o no MP3)
+        self.painted = False
+        self.measure_startup = False
         
         # --- CONFIGURACIÓN DE ANIMACIÓN ASCII ---
         # Logo base
@@ -133,21 +239,26 @@ class CompressorApp(QWidget):
 
         # Caracteres para el efecto "Matrix Rain"
         self.matrix_chars = "010101XYZA$#@&%* " # Agregamos espacios para que no sea SOLO ruido
+        # Los fotogramas se calculan una sola vez: cada tic solo cambia el texto del QLabel
+        self.glitch_frames = make_glitch_frames(self.rect_ascii, self.matrix_chars)
+        self.frame_index = 0
         
-        # Timer para la animación
+        # Timer para la animación (impreciso a propósito: menos despertares de la CPU)
         self.anim_timer = QTimer()
+        self.anim_timer.setTimerType(Qt.TimerType.CoarseTimer)
         self.anim_timer.timeout.connect(self.animate_ascii)
         
         # Inicializar UI
         self.init_ui()
-        # Inicializar Audio
-        self.init_audio()
-        # Aplicar tema por defecto
+        # Aplicar tema por defecto (el audio espera al primer pintado: ver first_paint)
         self.apply_theme("KEYGEN STYLE")
 
     def init_audio(self):
-        """Configura el reproductor de música"""
+        """Configura el reproductor de música (la primera vez que el tema keygen lo pide)"""
+        self.audio_checked = True
         try:
+            from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
+
             self.player = QMediaPlayer()
             self.audio_output = QAudioOutput()
             self.player.setAudioOutput(self.audio_output)
@@ -181,9 +292,34 @@ class CompressorApp(QWidget):
             print(f"Error de audio: {e}")
             self.has_audio = False
 
+    def start_audio(self):
+        if not self.audio_checked:
+            self.init_audio()
+        if self.has_audio:
+            if self.player.playbackState() != self.player.PlaybackState.PlayingState:
+                self.player.play()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.painted:
+            self.painted = True
+            # Lo diferido va en la siguiente vuelta del bucle: la ventana ya está en pantalla
+            QTimer.singleShot(0, self.first_paint)
+
+    def first_paint(self):
+        """Carga lo que no hacía falta para enseñar la ventana"""
+        painted = time.perf_counter()
+        if self.theme_selector.currentText() == "KEYGEN STYLE":
+            self.start_audio()
+        if self.measure_startup:
+            print(f">> STARTUP: IMPORTS {(_T_IMPORTS - _T_START) * 1000:.0f} ms, "
+                  f"FIRST PAINT {(painted - _T_START) * 1000:.0f} ms, "
+                  f"DEFERRED (AUDIO) {(time.perf_counter() - painted) * 1000:.0f} ms")
+            QApplication.quit()
+
     def init_ui(self):
         self.setWindowTitle("HYPER-SHRINK 3000") 
-        self.setGeometry(100, 100, 520, 720)
+        self.setGeometry(100, 100, 560, 860)
         
         layout = QVBoxLayout()
         layout.setSpacing(15)
@@ -201,6 +337,17 @@ class CompressorApp(QWidget):
         self.theme_selector.setCursor(Qt.CursorShape.PointingHandCursor)
         self.theme_selector.currentTextChanged.connect(self.apply_theme)
         theme_layout.addWidget(self.theme_selector)
+
+        # Fotogramas por segundo del logo (OFF = estático)
+        self.fps_label = QLabel("FX:")
+        self.fps_label.setFont(QFont("Arial", 10, QFont.Weight.Bold))
+        theme_layout.addWidget(self.fps_label)
+        self.fps_selector = QComboBox()
+        self.fps_selector.addItems(list(ANIM_FPS_OPTIONS))
+        self.fps_selector.setCurrentText(DEFAULT_ANIM_FPS)
+        self.fps_selector.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.fps_selector.currentTextChanged.connect(self.update_animation)
+        theme_layout.addWidget(self.fps_selector)
         
         layout.addLayout(theme_layout)
 
@@ -258,11 +405,25 @@ class CompressorApp(QWidget):
         layout.addWidget(self.pbar)
 
         # Log
-        self.log_box = QTextEdit()
+        self.log_box = QPlainTextEdit()
         self.log_box.setReadOnly(True)
-        self.log_box.setText(">> WAITING FOR USER INPUT...")
+        self.log_box.setMaximumBlockCount(LOG_MAX_LINES)
+        self.log_box.setPlainText(">> WAITING FOR USER INPUT...")
         layout.addWidget(self.log_box)
 
+        # Resultados por imagen
+        self.results = ResultModel(["FILE", "ORIGINAL", "RESULT", "FORMAT", "STATUS"])
+        self.results_view = QTableView()
+        self.results_view.setModel(self.results)
+        self.results_view.verticalHeader().hide()
+        self.results_view.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.results_view.verticalHeader().setDefaultSectionSize(20)
+        self.results_view.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        self.results_view.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.results_view.horizontalHeader().setStretchLastSection(True)
+        self.results_view.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
+        layout.addWidget(self.results_view)
+
         # Botón Inicio
         self.btn_start = QPushButton(">> EXECUTE <<")
         self.btn_start.setCursor(Qt.CursorShape.PointingHandCursor)
@@ -270,6 +431,21 @@ class CompressorApp(QWidget):
         self.btn_start.clicked.connect(self.start_process)
         layout.addWidget(self.btn_start)
 
+        # Pausa / cancelación (solo activos durante el proceso)
+        control_layout = QHBoxLayout()
+        self.btn_pause = QPushButton("[ PAUSE ]")
+        self.btn_pause.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.btn_pause.setEnabled(False)
+        self.btn_pause.clicked.connect(self.toggle_pause)
+        control_layout.addWidget(self.btn_pause)
+
+        self.btn_abort = QPushButton("[ ABORT ]")
+        self.btn_abort.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.btn_abort.setEnabled(False)
+        self.btn_abort.clicked.connect(self.abort_process)
+        control_layout.addWidget(self.btn_abort)
+        layout.addLayout(control_layout)
+
         # Branding (Inicialización con soporte para links)
         self.branding_label = QLabel()
         self.branding_label.setOpenExternalLinks(True) # ¡Importante! Permite hacer clic
@@ -279,39 +455,64 @@ class CompressorApp(QWidget):
         self.setLayout(layout)
 
     def animate_ascii(self):
-        """Genera el efecto glitch/matrix en TODO el cuadro del logo"""
-        final_text = []
-        
-        for char in self.rect_ascii:
-            if char == '\n':
-                final_text.append('\n')
-            # Probabilidad de glitch (15%) afecta a CUALQUIER caracter (letras o espacios)
-            elif random.random() < 0.15: 
-                final_text.append(random.choice(self.matrix_chars))
-            else:
-                final_text.append(char)
-        
-        self.ascii_label.setText("".join(final_text))
+        """Muestra el siguiente fotograma precalculado del efecto glitch"""
+        self.ascii_label.setText(self.glitch_frames[self.frame_index])
+        self.frame_index = (self.frame_index + 1) % len(self.glitch_frames)
+
+    def update_animation(self, *_):
+        """
+        Arranca, ajusta o para la animación del logo. Solo corre con el tema
+        keygen, FPS distinto de OFF, la ventana visible y sin un proceso en
+        marcha: mientras se comprime el hilo de la GUI no compite por el GIL.
+        """
+        fps = ANIM_FPS_OPTIONS[self.fps_selector.currentText()]
+        busy = self.worker is not None and self.worker.isRunning()
+        if (fps and not busy and self.theme_selector.currentText() == "KEYGEN STYLE"
+                and self.isVisible() and not self.isMinimized()):
+            interval = 1000 // fps
+            if not self.anim_timer.isActive() or self.anim_timer.interval() != interval:
+                self.anim_timer.start(interval)
+        elif self.anim_timer.isActive():
+            self.anim_timer.stop()
+            # Restaurar texto original limpio (sin glitches)
+            self.ascii_label.setText(self.rect_ascii)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.update_animation()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.update_animation()
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.Type.WindowStateChange: # Minimizar / restaurar
+            self.update_animation()
 
     def apply_theme(self, theme_name):
         if theme_name == "KEYGEN STYLE":
             # --- ACTIVAR ANIMACIÓN Y MÚSICA ---
-            self.anim_timer.start(80) # Un poco más rápido para más caos
+            self.update_animation()
             
-            if self.has_audio:
-                if self.player.playbackState() != QMediaPlayer.PlaybackState.PlayingState:
-                    self.player.play()
+            if self.painted: # Al arrancar, first_paint se encarga
+                self.start_audio()
 
             # --- ESTILO HACKER ---
             self.setWindowTitle("HYPER-SHRINK 3000 [Unregistered]")
             self.ascii_label.show()
+            self.fps_label.show()
+            self.fps_selector.show()
             self.title_label.setText("HYPER-SHRINK 3000")
             self.title_label.setFont(QFont("Courier New", 20, QFont.Weight.Bold))
             self.subtitle_label.setText(">> SYSTEM READY <<")
             
             self.btn_select.setText("[ SELECT DIRECTORY ]")
             self.btn_start.setText(">> EXECUTE <<")
+            self.btn_pause.setText("[ PAUSE ]")
+            self.btn_abort.setText("[ ABORT ]")
             self.slider_label.setText("COMPRESSION LIMIT:")
+            self.results.set_headers(["FILE", "ORIGINAL", "RESULT", "FORMAT", "STATUS"])
 
             # Branding con estilo HTML para el link (Verde oscuro)
             self.branding_label.setText('<a href="https://linktr.ee/az1fr3" style="color: #004400; text-decoration: none;">Created by Azufr3</a>')
@@ -325,7 +526,9 @@ class CompressorApp(QWidget):
                 QPushButton:disabled { border: 2px solid #004400; color: #004400; }
                 QProgressBar { border: 2px solid #00FF00; text-align: center; color: #000000; }
                 QProgressBar::chunk { background-color: #00FF00; }
-                QTextEdit { background-color: #050505; border: 1px dashed #00FF00; color: #00FF00; }
+                QPlainTextEdit { background-color: #050505; border: 1px dashed #00FF00; color: #00FF00; }
+                QTableView { background-color: #050505; border: 1px dashed #00FF00; color: #00FF00; gridline-color: #004400; }
+                QHeaderView::section { background-color: #000000; color: #00FF00; border: 1px solid #004400; }
                 QSlider::groove:horizontal { height: 4px; background: #004400; }
                 QSlider::handle:horizontal { background: #00FF00; width: 10px; margin: -5px 0; }
                 QFrame { border: 1px solid #00FF00; }
@@ -333,9 +536,7 @@ class CompressorApp(QWidget):
             
         else:
             # --- DESACTIVAR ANIMACIÓN Y MÚSICA ---
-            self.anim_timer.stop()
-            # Restaurar texto original limpio (sin glitches)
-            self.ascii_label.setText(self.rect_ascii) 
+            self.update_animation()
             
             if self.has_audio:
                 self.player.stop()
@@ -343,13 +544,18 @@ class CompressorApp(QWidget):
             # --- ESTILO NATIVO ---
             self.setWindowTitle("Compresor de Imágenes")
             self.ascii_label.hide()
+            self.fps_label.hide()
+            self.fps_selector.hide()
             self.title_label.setText("Compresor de Imágenes")
             self.title_label.setFont(QFont("Helvetica", 18, QFont.Weight.Bold))
             self.subtitle_label.setText("Modo Profesional Activado")
             
             self.btn_select.setText("Seleccionar Carpeta")
             self.btn_start.setText("Iniciar Compresión")
+            self.btn_pause.setText("Pausar")
+            self.btn_abort.setText("Cancelar")
             self.slider_label.setText("Tamaño Máximo:")
+            self.results.set_headers(["Archivo", "Original", "Resultado", "Formato", "Estado"])
 
             # Branding con estilo HTML para el link (Gris profesional)
             self.branding_label.setText('<a href="https://linktr.ee/az1fr3" style="color: #888888; text-decoration: none;">Created by Azufr3</a>')
@@ -376,12 +582,30 @@ class CompressorApp(QWidget):
 
             self.btn_start.setEnabled(True)
             self.pbar.setValue(0)
+            self.pbar.setFormat("%p%")
 
     def update_slider(self, value):
         self.lbl_slider_val.setText(f"{value} MB")
 
     def log_msg(self, msg):
-        self.log_box.append(msg)
+        self.log_box.appendPlainText(msg)
+
+    def drain_worker(self):
+        """Pinta de una vez lo acumulado por el Worker desde el último tic"""
+        if self.worker is None: return
+        lines, rows, progress = self.worker.take()
+        if lines:
+            self.log_box.appendPlainText("\n".join(lines))
+        if rows:
+            scrollbar = self.results_view.verticalScrollBar()
+            at_bottom = scrollbar.value() == scrollbar.maximum()
+            self.results.add_rows(rows)
+            if at_bottom: # No arrastrar al usuario si está revisando filas anteriores
+                self.results_view.scrollToBottom()
+        if progress is not None:
+            percent, eta = progress
+            self.update_progress(int(percent))
+            self.update_eta(eta)
 
     def start_process(self):
         if not self.folder_path: return
@@ -397,27 +621,80 @@ class CompressorApp(QWidget):
             self.log_msg("\nIniciando proceso...")
 
         self.worker = Worker(self.folder_path, self.slider.value())
-        self.worker.progress.connect(self.update_progress)
-        self.worker.log.connect(self.log_msg)
         self.worker.finished.connect(self.process_finished)
+        self.results.clear()
         self.worker.start()
+        self.ui_timer.start()
+        self.update_animation() # Logo quieto mientras se comprime
+        self.btn_pause.setEnabled(True)
+        self.btn_abort.setEnabled(True)
+
+    def pause_texts(self):
+        """Textos del botón de pausa en el tema actual: (pausar, reanudar)"""
+        if self.theme_selector.currentText() == "KEYGEN STYLE":
+            return "[ PAUSE ]", "[ RESUME ]"
+        return "Pausar", "Reanudar"
+
+    def toggle_pause(self):
+        if self.worker is None: return
+        is_keygen = self.theme_selector.currentText() == "KEYGEN STYLE"
+        pause_text, resume_text = self.pause_texts()
+        if self.worker.control.paused:
+            self.worker.resume()
+            self.btn_pause.setText(pause_text)
+            self.log_msg(">> RESUMED" if is_keygen else "Reanudado")
+        else:
+            self.worker.pause()
+            self.btn_pause.setText(resume_text)
+            self.log_msg(">> PAUSED" if is_keygen else "En pausa")
+
+    def abort_process(self):
+        if self.worker is None: return
+        self.worker.stop()
+        self.btn_pause.setEnabled(False)
+        self.btn_abort.setEnabled(False)
+        is_keygen = self.theme_selector.currentText() == "KEYGEN STYLE"
+        self.log_msg(">> ABORTING..." if is_keygen else "Cancelando...")
+
+    def closeEvent(self, event):
+        # Cerrar la ventana cancela la pasada; lo ya comprimido queda en el manifiesto
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.stop()
+            self.worker.wait()
+        super().closeEvent(event)
 
     def update_progress(self, val):
         self.pbar.setValue(val)
 
-    def process_finished(self, count, out_folder):
+    def update_eta(self, eta):
+        self.pbar.setFormat(f"%p%  ETA {eta}")
+
+    def process_finished(self, count, out_folder, cancelled):
+        self.ui_timer.stop()
+        self.drain_worker() # Lo último que quedó pendiente
+        self.worker.wait() # finished llega justo antes de que el hilo termine
+        self.update_animation()
         self.btn_select.setEnabled(True)
         self.btn_start.setEnabled(True)
         self.slider.setEnabled(True)
         self.theme_selector.setEnabled(True)
+        self.btn_pause.setEnabled(False)
+        self.btn_abort.setEnabled(False)
+        self.btn_pause.setText(self.pause_texts()[0])
         
         is_keygen = self.theme_selector.currentText() == "KEYGEN STYLE"
         
-        msg_title = "SUCCESS" if is_keygen else "Éxito"
-        msg_body = f"OPERATION COMPLETED.\nPROCESSED: {count}" if is_keygen else f"Proceso finalizado.\nImágenes procesadas: {count}"
+        if cancelled:
+            msg_title = "ABORTED" if is_keygen else "Cancelado"
+            msg_body = (f"OPERATION ABORTED.\nPROCESSED: {count}\nEXECUTE AGAIN TO RESUME." if is_keygen
+                        else f"Proceso cancelado.\nImágenes procesadas: {count}\nVuelve a iniciarlo para continuar.")
+        else:
+            msg_title = "SUCCESS" if is_keygen else "Éxito"
+            msg_body = f"OPERATION COMPLETED.\nPROCESSED: {count}" if is_keygen else f"Proceso finalizado.\nImágenes procesadas: {count}"
         
         self.log_msg(f"\n>> {msg_body}")
         QMessageBox.information(self, msg_title, msg_body)
+        if cancelled: return
         
         if sys.platform == 'darwin':
             os.system(f'open "{out_folder}"')
@@ -425,7 +702,9 @@ class CompressorApp(QWidget):
             os.startfile(out_folder)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # Necesario para el pool en la app empaquetada
     app = QApplication(sys.argv)
     window = CompressorApp()
+    window.measure_startup = STARTUP_TIME_FLAG in sys.argv
     window.show()
     sys.exit(app.exec())
\ No newline at end of file
@@ -0,0 +1,319 @@
+"""
+Banco de pruebas del motor de compresión de HYPER-SHRINK 3000.
+
+Genera un corpus sintético reproducible (varias resoluciones, todos los
+formatos admitidos, contenido con ruido tipo foto y contenido plano tipo
+captura de pantalla) y mide cada imagen en un proceso limpio: intentos de
+codificación, tiempo real, tiempo de CPU, pico de memoria (RSS), tamaño
+final frente al objetivo y megapíxeles por segundo. Con NumPy mide además
+el SSIM de cada salida frente al original, para comparar el modo
+perceptual con el normal. También comprueba que la deduplicación "near"
+reconoce una reexportación en JPEG y una copia reducida de una imagen.
+
+    python ImgCompress_bench.py [--preset quick|standard|large] [--json out.json]
+                                [--compare base.json] [--repeat N] [--perceptual]
+
+El JSON de --json sirve después como base para --compare.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import PIL
+from PIL import Image, ImageDraw, ImageFilter
+
+from ImgCompress_dedup import near_groups, perceptual_hashes
+from ImgCompress_engine import DEFAULT_FORMAT, OUTPUT_FORMATS, compress_file
+from ImgCompress_quality import available as ssim_available, output_ssim
+from ImgCompress_scan import VALID_EXTENSIONS
+
+try:
+    import resource
+except ImportError:  # Windows: sin pico de RSS
+    resource = None
+
+BENCH_VERSION = 1
+DEFAULT_SEED = 3000
+DEFAULT_TARGET_BPP = 1.0  # Objetivo en bits por píxel: igual de exigente a cualquier resolución
+
+# (nombre, ancho, alto) por preset
+PRESETS = {
+    "quick": [("2mp", 1600, 1200)],
+    "standard": [("2mp", 1600, 1200), ("12mp", 4000, 3000)],
+    "large": [("2mp", 1600, 1200), ("12mp", 4000, 3000), ("24mp", 6000, 4000), ("50mp", 8660, 5774)],
+}
+CONTENTS = ("noisy", "flat")
+SAVE_FORMATS = {".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG", ".webp": "WEBP", ".tiff": "TIFF", ".bmp": "BMP"}
+
+
+# --- CORPUS SINTÉTICO ---
+
+def _noisy_image(width, height, rng):
+    """Degradados suaves + ruido: se comprime como una foto de cámara"""
+    small = Image.new("RGB", (16, 12))
+    small.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(16 * 12)])
+    base = small.resize((width, height), Image.Resampling.BICUBIC)
+    noise = Image.frombytes("RGB", (width, height), rng.randbytes(width * height * 3))
+    noise = noise.filter(ImageFilter.GaussianBlur(0.6))
+    return Image.blend(base, noise, 0.35)
+
+
+def _flat_image(width, height, rng):
+    """Bloques de color liso y texto falso: se comprime como una captura de pantalla"""
+    img = Image.new("RGB", (width, height), (240, 240, 240))
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = x0 + rng.randrange(width // 3), y0 + rng.randrange(height // 3)
+        draw.rectangle((x0, y0, x1, y1), fill=tuple(rng.randrange(256) for _ in range(3)))
+    line_h = max(8, height // 80)
+    for y in range(0, height, line_h * 2):
+        x = rng.randrange(width // 10)
+        while x < width:
+            w = rng.randrange(line_h, line_h * 6)
+            draw.rectangle((x, y, x + w, y + line_h // 2), fill=(30, 30, 30))
+            x += w + line_h
+    return img
+
+
+def build_corpus(folder, preset, seed=DEFAULT_SEED):
+    """Crea (si no existen ya) las imágenes del preset y devuelve la lista de casos"""
+    os.makedirs(folder, exist_ok=True)
+    cases = []
+    for res_name, width, height in PRESETS[preset]:
+        for content in CONTENTS:
+            for ext in VALID_EXTENSIONS:
+                name = f"{res_name}_{content}{ext}"
+                path = os.path.join(folder, name)
+                if not os.path.exists(path):
+                    # Semilla por caso: regenerar uno no cambia los demás
+                    rng = random.Random(f"{seed}:{res_name}:{content}")
+                    make = _noisy_image if content == "noisy" else _flat_image
+                    make(width, height, rng).save(path, SAVE_FORMATS[ext])
+                cases.append({"name": name, "path": path, "width": width, "height": height,
+                              "content": content, "format": ext.lstrip(".")})
+    return cases
+
+
+def check_near_duplicates(folder, seed=DEFAULT_SEED):
+    """
+    Un PNG, su reexportación en JPEG y una copia JPEG a media resolución
+    tienen que caer en un mismo grupo "near" (ver ImgCompress_dedup).
+    Devuelve la mayor distancia en bits entre sus hashes, o None si no se
+    agrupan.
+    """
+    os.makedirs(folder, exist_ok=True)
+    img = _noisy_image(1600, 1200, random.Random(f"{seed}:near"))
+    paths = [os.path.join(folder, name) for name in ("original.png", "reexport.jpg", "half.jpg")]
+    img.save(paths[0], "PNG")
+    img.save(paths[1], "JPEG", quality=85)
+    img.resize((800, 600), Image.Resampling.LANCZOS).save(paths[2], "JPEG", quality=90)
+    hashes = perceptual_hashes(paths)
+    items = [(path, *hashes[path]) for path in paths if path in hashes]
+    if sorted(map(sorted, near_groups(items))) != [sorted(paths)]:
+        return None
+    return max(bin(a[1] ^ b[1]).count("1") for a in items for b in items)
+
+
+# --- MEDICIÓN ---
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB, macOS en bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _output_ssim(src, dst):
+    """
+    SSIM de la salida frente al original, o None sin NumPy. Se mide sobre el
+    mosaico de recortes de ImgCompress_quality y no sobre la imagen entera:
+    en el preset large serían varios GB de arrays y se mediría el banco más
+    que el motor.
+    """
+    if not ssim_available():
+        return None
+    with Image.open(src) as original, Image.open(dst) as output:
+        return output_ssim(original, output)
+
+
+def _measure(src, dst, limit_bytes, output_format=DEFAULT_FORMAT, perceptual=False):
+    """Se ejecuta en un proceso nuevo para que el pico de RSS sea solo de esta imagen"""
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    result = compress_file(src, dst, limit_bytes, output_format=output_format, perceptual=perceptual)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    return {
+        "wall_s": wall,
+        "cpu_s": cpu,
+        "peak_rss_mb": _peak_rss_mb(),
+        "attempts": result.attempts,
+        "size": result.size,
+        "quality": result.quality,
+        "scale": result.scale,
+        "codec": result.codec,
+        "error": result.error,
+        "ssim": _output_ssim(src, result.dst) if result.ok else None,
+    }
+
+
+def run_case(case, output_folder, limit_bytes, repeat=1, output_format=DEFAULT_FORMAT, perceptual=False):
+    dst = os.path.join(output_folder, os.path.splitext(case["name"])[0] + "_bench.jpg")
+    runs = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            runs.append(pool.submit(_measure, case["path"], dst, limit_bytes, output_format, perceptual).result())
+
+    record = dict(runs[-1])
+    record["wall_s"] = statistics.median(r["wall_s"] for r in runs)
+    record["cpu_s"] = statistics.median(r["cpu_s"] for r in runs)
+    megapixels = case["width"] * case["height"] / 1e6
+    record.update({
+        "name": case["name"],
+        "content": case["content"],
+        "format": case["format"],
+        "megapixels": megapixels,
+        "source_bytes": os.path.getsize(case["path"]),
+        "limit_bytes": limit_bytes,
+        "size_ratio": record["size"] / limit_bytes if record["size"] else None,
+        "mp_per_s": megapixels / record["wall_s"] if record["wall_s"] else None,
+    })
+    return record
+
+
+def summarize(records):
+    ok = [r for r in records if r["size"]]
+    wall = sum(r["wall_s"] for r in records)
+    return {
+        "images": len(records),
+        "failed": len(records) - len(ok),
+        "wall_s": wall,
+        "cpu_s": sum(r["cpu_s"] for r in records),
+        "attempts_mean": statistics.mean(r["attempts"] for r in ok) if ok else None,
+        "size_ratio_mean": statistics.mean(r["size_ratio"] for r in ok) if ok else None,
+        "ssim_mean": statistics.mean(r["ssim"] for r in ok) if ok and ok[0].get("ssim") is not None else None,
+        "peak_rss_mb_max": max((r["peak_rss_mb"] or 0) for r in records) if records else None,
+        "mp_per_s": sum(r["megapixels"] for r in records) / wall if wall else None,
+    }
+
+
+def environment():
+    return {
+        "bench_version": BENCH_VERSION,
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+# --- INFORME ---
+
+def print_table(records, summary):
+    header = (f"{'IMAGE':<22}{'MP':>6}{'ENC':>5}{'WALL s':>9}{'CPU s':>8}{'RSS MB':>8}{'SIZE/LIM':>10}{'MP/s':>8}"
+              f"{'SSIM':>8}")
+    print(header)
+    print("-" * len(header))
+    for r in records:
+        ratio = f"{r['size_ratio']:.3f}" if r["size_ratio"] else "FAIL"
+        rss = f"{r['peak_rss_mb']:.0f}" if r["peak_rss_mb"] is not None else "-"
+        score = f"{r['ssim']:.4f}" if r.get("ssim") is not None else "-"
+        print(f"{r['name']:<22}{r['megapixels']:>6.1f}{r['attempts']:>5}{r['wall_s']:>9.2f}"
+              f"{r['cpu_s']:>8.2f}{rss:>8}{ratio:>10}{r['mp_per_s']:>8.1f}{score:>8}")
+    print("-" * len(header))
+    print(f">> {summary['images']} IMAGES, {summary['failed']} FAILED, {summary['wall_s']:.1f} s WALL, "
+          f"{summary['cpu_s']:.1f} s CPU, {summary['mp_per_s']:.1f} MP/s")
+    if summary.get("ssim_mean") is not None:
+        print(f">> MEAN SSIM: {summary['ssim_mean']:.4f}")
+
+
+def print_comparison(records, baseline):
+    base = {r["name"]: r for r in baseline["records"]}
+    print(f"\n{'IMAGE':<22}{'WALL x':>9}{'ENC Δ':>7}{'SIZE/LIM Δ':>12}{'SSIM Δ':>9}")
+    for r in records:
+        b = base.get(r["name"])
+        if b is None or not b["wall_s"]:
+            continue
+        ratio_delta = (r["size_ratio"] or 0) - (b["size_ratio"] or 0)
+        if r.get("ssim") is not None and b.get("ssim") is not None:
+            ssim_delta = f"{r['ssim'] - b['ssim']:>+9.4f}"
+        else:
+            ssim_delta = f"{'-':>9}"
+        print(f"{r['name']:<22}{r['wall_s'] / b['wall_s']:>9.2f}{r['attempts'] - b['attempts']:>+7}"
+              f"{ratio_delta:>+12.3f}{ssim_delta}")
+    total, base_total = summarize(records)["wall_s"], baseline["summary"]["wall_s"]
+    if base_total:
+        print(f">> TOTAL WALL: {total:.1f} s vs {base_total:.1f} s ({total / base_total:.2f}x)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="ImgCompress_bench",
+                                     description="Mide el motor de compresión sobre un corpus sintético.")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="standard",
+                        help="resoluciones del corpus (por defecto standard)")
+    parser.add_argument("--corpus", default=None,
+                        help="carpeta del corpus; se reutiliza entre ejecuciones (por defecto en /tmp)")
+    parser.add_argument("--target-bpp", type=float, default=DEFAULT_TARGET_BPP,
+                        help=f"objetivo en bits por píxel (por defecto {DEFAULT_TARGET_BPP})")
+    parser.add_argument("--target-mb", type=float, default=None,
+                        help="objetivo fijo en MB para todas las imágenes (ignora --target-bpp)")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default=DEFAULT_FORMAT,
+                        help=f"formato de salida (por defecto {DEFAULT_FORMAT})")
+    parser.add_argument("--perceptual", action="store_true",
+                        help="usar el modo perceptual (SSIM) del motor; necesita NumPy")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--repeat", type=int, default=1, help="repeticiones por imagen (se usa la mediana)")
+    parser.add_argument("--only", default=None, help="solo casos cuyo nombre contenga este texto")
+    parser.add_argument("--json", default=None, help="guardar los resultados en este archivo JSON")
+    parser.add_argument("--compare", default=None, help="JSON de una ejecución anterior para comparar")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    corpus = args.corpus or os.path.join(tempfile.gettempdir(), f"hypershrink_bench_{args.seed}")
+    cases = build_corpus(corpus, args.preset, args.seed)
+    if args.only:
+        cases = [c for c in cases if args.only in c["name"]]
+
+    records = []
+    with tempfile.TemporaryDirectory() as output_folder:
+        for case in cases:
+            if args.target_mb:
+                limit_bytes = int(args.target_mb * 1024 * 1024)
+            else:
+                limit_bytes = int(case["width"] * case["height"] * args.target_bpp / 8)
+            records.append(run_case(case, output_folder, limit_bytes, args.repeat, args.format, args.perceptual))
+
+    summary = summarize(records)
+    print_table(records, summary)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print_comparison(records, json.load(f))
+
+    if args.json:
+        report = {"environment": environment(), "args": vars(args), "records": records, "summary": summary}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f">> RESULTS SAVED TO {args.json}")
+
+    distance = check_near_duplicates(os.path.join(corpus, "near"), args.seed)
+    if distance is None:
+        print(">> NEAR-DUPLICATE CHECK FAILED: A JPEG RE-EXPORT WAS NOT GROUPED WITH ITS ORIGINAL")
+        return 1
+    print(f">> NEAR-DUPLICATE CHECK OK ({distance} BITS APART AT MOST)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+HYPER-SHRINK 3000 en modo consola (sin GUI).
+
+Pensado para servidores sin pantalla y tareas programadas (cron):
+solo necesita Pillow.
+
+    python ImgCompress_cli.py CARPETA [--target-mb 16] [--output DIR] [--format auto]
+                              [--workers N] [--recursive] [--mirror]
+                              [--include GLOB] [--exclude GLOB] [--watch] [--perceptual]
+
+Ctrl+C cancela la pasada (un segundo Ctrl+C corta también la imagen en
+curso) y relanzar la misma orden continúa donde se quedó. En sistemas con
+SIGUSR1, `kill -USR1 PID` la pausa y la reanuda.
+
+Con --watch no termina: tras la pasada inicial sigue comprimiendo las
+imágenes nuevas o modificadas según llegan (ver ImgCompress_watch), hasta
+Ctrl+C.
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import sys
+
+from ImgCompress_control import BatchControl
+from ImgCompress_dedup import DEDUP_MODES, DEFAULT_DEDUP
+from ImgCompress_engine import (DEFAULT_FORMAT, DEFAULT_PREFETCH, DEFAULT_SUFFIX, DEFAULT_TARGET_MB, OUTPUT_FORMATS,
+                                default_workers, format_eta, run_batch)
+from ImgCompress_quality import available as perceptual_available
+from ImgCompress_report import format_report
+from ImgCompress_watch import DEFAULT_POLL_S, DEFAULT_SETTLE_S, watch_batch
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="ImgCompress_cli",
+        description="Comprime las imágenes de una carpeta por debajo de un tamaño objetivo.")
+    parser.add_argument("folder", help="carpeta con las imágenes originales")
+    parser.add_argument("-t", "--target-mb", type=float, default=DEFAULT_TARGET_MB,
+                        help=f"tamaño máximo por imagen en MB (por defecto {DEFAULT_TARGET_MB})")
+    parser.add_argument("-o", "--output", default=None,
+                        help="carpeta de salida (por defecto CARPETA/X-TREME_COMPRESSED)")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help=f"procesos en paralelo (por defecto {default_workers()}, uno por núcleo)")
+    parser.add_argument("-f", "--format", choices=OUTPUT_FORMATS, default=DEFAULT_FORMAT,
+                        help=f"formato de salida; auto elige por imagen (por defecto {DEFAULT_FORMAT})")
+    parser.add_argument("--dedup", choices=DEDUP_MODES, default=DEFAULT_DEDUP,
+                        help="comprimir una sola vez las imágenes repetidas y enlazar las copias: exact "
+                             f"(mismo contenido), near (también reexportaciones parecidas) u off "
+                             f"(por defecto {DEFAULT_DEDUP})")
+    parser.add_argument("--perceptual", action="store_true",
+                        help="elegir calidad/escala por calidad visual (SSIM) y no solo por tamaño; necesita NumPy")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="procesar también las subcarpetas")
+    parser.add_argument("--include", action="append", default=[], metavar="GLOB",
+                        help="procesar solo archivos que casen con GLOB (repetible)")
+    parser.add_argument("--exclude", action="append", default=[], metavar="GLOB",
+                        help="ignorar archivos o carpetas que casen con GLOB (repetible)")
+    parser.add_argument("--mirror", action="store_true",
+                        help="replicar la estructura de subcarpetas en la salida")
+    parser.add_argument("--stream", action="store_true",
+                        help="comprimir según se descubre, sin planificar antes (árboles enormes)")
+    parser.add_argument("--log-json", default=None, metavar="PATH",
+                        help="guardar todos los eventos (con tiempos por etapa) como JSON-lines")
+    parser.add_argument("--memory-mb", type=float, default=None, metavar="MB",
+                        help="memoria máxima por proceso; los JPEG enormes se decodifican reducidos "
+                             "y las imágenes grandes no coinciden en paralelo")
+    parser.add_argument("--max-megapixels", type=float, default=None, metavar="MP",
+                        help="aceptar imágenes de hasta MP megapíxeles (por defecto el límite de Pillow)")
+    parser.add_argument("--fsync-every", type=int, default=0, metavar="N",
+                        help="forzar a disco las salidas cada N imágenes (volúmenes de red; por defecto nunca)")
+    parser.add_argument("--prefetch", type=int, default=DEFAULT_PREFETCH, metavar="N",
+                        help="originales que se leen por adelantado mientras se codifica, y escrituras "
+                             f"pendientes como máximo (por defecto {DEFAULT_PREFETCH}; 0 = sin solapar E/S)")
+    parser.add_argument("--watch", action="store_true",
+                        help="seguir vigilando la carpeta y comprimir lo que llegue (hasta Ctrl+C)")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE_S, metavar="S",
+                        help=f"con --watch, segundos sin cambios antes de comprimir un archivo "
+                             f"(por defecto {DEFAULT_SETTLE_S:g})")
+    parser.add_argument("--poll", type=float, default=None, metavar="S",
+                        help=f"con --watch, sondear cada S segundos en vez de usar inotify "
+                             f"(sin inotify se sondea cada {DEFAULT_POLL_S:g})")
+    parser.add_argument("--suffix", default=DEFAULT_SUFFIX,
+                        help=f"sufijo de los archivos generados (por defecto {DEFAULT_SUFFIX})")
+    parser.add_argument("--no-manifest", action="store_true",
+                        help="ignorar el manifiesto y recomprimir todo")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="mostrar solo errores y el resumen final")
+    return parser
+
+
+def install_signals(control):
+    """Ctrl+C cancela (el segundo, sin esperar a la imagen en curso); SIGUSR1 pausa/reanuda"""
+    def on_interrupt(signum, frame):
+        if control.cancelled:
+            print(">> ABORTING NOW", file=sys.stderr)
+            control.cancel(kill=True)
+        else:
+            print(">> CANCELLING... (CTRL+C AGAIN TO ABORT NOW)", file=sys.stderr)
+            control.cancel()
+
+    def on_toggle(signum, frame):
+        if control.paused:
+            control.resume()
+            print(">> RESUMED", file=sys.stderr)
+        else:
+            control.pause()
+            print(">> PAUSED (SIGUSR1 TO RESUME)", file=sys.stderr)
+
+    signal.signal(signal.SIGINT, on_interrupt)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, on_toggle)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not os.path.isdir(args.folder):
+        print(f"ERROR: {args.folder} no es una carpeta", file=sys.stderr)
+        return 2
+    if args.watch and (args.stream or args.no_manifest):
+        # La vigilancia planifica cada tanda y depende del manifiesto para no recomprimir
+        option = "--stream" if args.stream else "--no-manifest"
+        print(f"ERROR: {option} no se puede combinar con --watch", file=sys.stderr)
+        return 2
+    if args.perceptual and not perceptual_available():
+        print("ERROR: --perceptual necesita NumPy (pip install numpy)", file=sys.stderr)
+        return 2
+
+    control = BatchControl()
+    install_signals(control)
+    cancelled = False
+    watching = False  # Con --watch, ya terminó la pasada inicial
+    failures = 0
+    if args.watch:
+        events = watch_batch(args.folder, args.target_mb, args.output, args.suffix, args.workers,
+                             args.recursive, args.include, args.exclude, args.mirror, args.log_json,
+                             args.fsync_every, args.memory_mb, args.max_megapixels, args.format, control,
+                             args.settle, args.poll or DEFAULT_POLL_S, polling=args.poll is not None,
+                             dedup=args.dedup, perceptual=args.perceptual, prefetch=args.prefetch)
+    else:
+        events = run_batch(args.folder, args.target_mb, args.output, args.suffix,
+                           args.workers, args.recursive, not args.no_manifest,
+                           args.include, args.exclude, args.mirror, not args.stream, args.log_json,
+                           args.fsync_every, args.memory_mb, args.max_megapixels, args.format, control,
+                           dedup=args.dedup, perceptual=args.perceptual, prefetch=args.prefetch)
+    for event in events:
+        if event["type"] == "watching":
+            watching = True
+            print(f">> WATCHING {event['folder']} ({event['backend'].upper()}). CTRL+C TO STOP")
+
+        elif event["type"] == "scan_done":
+            if not args.quiet and not watching:
+                print(f">> SCAN COMPLETE: {event['total']} FILES FOUND, {event['jobs']} TO COMPRESS "
+                      f"({event['megapixels']:.0f} MP, LIMIT {args.target_mb:g} MB)")
+
+        elif event["type"] == "error":
+            failures += 1
+            print(f" [ERROR] {event['src']}: {event['error']}", file=sys.stderr)
+
+        elif event["type"] == "cached":
+            if not args.quiet:
+                print(f"[{event['done']}/{event['total']}] {event['result'].src}: [SKIP] ALREADY COMPRESSED")
+
+        elif event["type"] == "file":
+            result = event["result"]
+            prefix = f"[{event['percent']:5.1f}% ETA {format_eta(event['eta'])}] {result.src}"
+            if result.ok and result.duplicate:
+                if not args.quiet:
+                    print(f"{prefix}: [DUP] {result.duplicate.upper()} COPY OF {result.duplicate_of}, LINKED")
+            elif result.ok:
+                if not args.quiet:
+                    print(f"{prefix}: {result.original_size/1024/1024:.1f} MB -> {result.size/1024/1024:.1f} MB "
+                          f"{result.codec.upper()}")
+            else:
+                failures += 1
+                reason = result.error or "COULD NOT COMPRESS"
+                print(f"{prefix}: [FAIL] {reason}", file=sys.stderr)
+
+        elif event["type"] == "end" and watching:
+            # Cada tanda vigilada es una pasada pequeña: sin informe completo
+            if event["count"] and not args.quiet:
+                print(f">> {event['count']} NEW FILES COMPRESSED INTO {event['output']}")
+
+        elif event["type"] == "end":
+            cancelled = event["cancelled"] and not args.watch
+            if event["cancelled"]:
+                print(f">> JOB CANCELLED. {event['count']} FILES COMPRESSED INTO {event['output']}; "
+                      f"RUN AGAIN TO RESUME")
+            else:
+                print(f">> JOB DONE. {event['count']} FILES COMPRESSED INTO {event['output']}")
+            for line in format_report(event["report"]):
+                print(f"   {line}")
+
+    if cancelled:
+        return 130  # Convención de la shell para «terminado por Ctrl+C»
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
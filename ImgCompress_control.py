@@ -0,0 +1,80 @@
+"""
+Cancelación y pausa de una pasada de HYPER-SHRINK 3000.
+
+BatchControl se crea en el proceso principal (la GUI o la consola) y llega a
+los procesos del pool al arrancarlos. El motor llama a checkpoint() entre
+intentos y en cada bloque que escribe el codificador, así que pausar o
+cancelar surte efecto dentro de la codificación en curso y no al terminar la
+imagen. Lo ya comprimido queda en el manifiesto: relanzar la misma carpeta
+continúa donde se paró.
+"""
+import multiprocessing
+import signal
+import threading
+
+_local = threading.local()
+
+
+class Cancelled(Exception):
+    """La pasada se canceló mientras se comprimía una imagen"""
+
+
+class BatchControl:
+    """
+    Botones de pausa y cancelación de una pasada, seguros entre hilos y procesos.
+
+    Los estados son multiprocessing.Event para que los vean los procesos del
+    pool. Con cancel(kill=True) compress_batch además termina los procesos en
+    vez de esperar a que lleguen a su siguiente checkpoint.
+    """
+
+    def __init__(self):
+        self._cancelled = multiprocessing.Event()
+        self._running = multiprocessing.Event()  # Sin marcar = en pausa
+        self._running.set()
+        self.kill = False
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def cancel(self, kill=False):
+        self.kill = self.kill or kill
+        self._cancelled.set()
+        self._running.set()  # Una pausa no puede dejar bloqueada la cancelación
+
+    def pause(self):
+        if not self.cancelled:
+            self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def checkpoint(self):
+        """Espera mientras esté en pausa; lanza Cancelled si se ha cancelado"""
+        self._running.wait()
+        if self._cancelled.is_set():
+            raise Cancelled()
+
+
+def use_control(control):
+    """Asocia control al hilo actual (None lo quita): es el que consultará checkpoint()"""
+    _local.control = control
+
+
+def checkpoint():
+    """Punto de pausa/cancelación del motor; no hace nada si no hay control"""
+    control = getattr(_local, "control", None)
+    if control is not None:
+        control.checkpoint()
+
+
+def init_worker(control):
+    """Inicializador de los procesos del pool"""
+    # Ctrl+C llega a todo el grupo de procesos: solo el principal lo atiende (y cancela)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    use_control(control)
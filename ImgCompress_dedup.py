@@ -0,0 +1,180 @@
+"""
+Detección de imágenes repetidas para HYPER-SHRINK 3000.
+
+Las carpetas de fotos subidas por usuarios traen la misma imagen varias
+veces (copias, "IMG_001 (1).jpg", reexportaciones). Antes de comprimir se
+agrupan:
+
+- exactas: mismo contenido byte a byte. Solo se calcula el hash de los
+  archivos que comparten tamaño con algún otro.
+- casi iguales (opcional): mismo hash perceptual (dHash de 64 bits) salvo
+  unos pocos bits y misma proporción. Sirve para reexportaciones a otra
+  calidad o resolución; se queda como representante la de más píxeles.
+
+Solo se comprime el representante de cada grupo; el resto recibe un
+enlace duro a su salida (o una copia si el sistema de archivos no los
+admite). Ver BatchRun en ImgCompress_engine.
+"""
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+
+from PIL import Image
+
+from ImgCompress_manifest import file_digest
+from ImgCompress_scan import open_image
+
+DEDUP_MODES = ("off", "exact", "near")
+DEFAULT_DEDUP = "exact"
+
+HASH_THREADS = 8         # Hilos para leer/hashear: hashlib y la decodificación de Pillow sueltan el GIL
+NEAR_DUP_BITS = 4        # Bits distintos (de 64) que se toleran entre casi iguales
+MIN_HASH_BITS = 8        # Hashes con menos bits a 1 (o a 0) son imágenes casi lisas: no se agrupan
+HASH_DRAFT = 256         # Lado mínimo al que se decodifican los JPEG para el hash (muy por encima de 9x8)
+ASPECT_TOLERANCE = 0.01  # Diferencia relativa de proporción admitida entre casi iguales
+
+
+def exact_groups(files, known=()):
+    """
+    Agrupa por contenido idéntico.
+
+    `files` son (ruta, tamaño) pendientes de comprimir y `known` son
+    (ruta, tamaño, hash) ya comprimidas en una pasada anterior: si una
+    pendiente coincide con una conocida, la conocida encabeza su grupo.
+    Devuelve (grupos, hashes): listas de rutas con el representante
+    primero, y el hash calculado de cada ruta pendiente que se leyó.
+    """
+    by_size = {}
+    # El nombre más corto representa al grupo: "IMG_001.jpg" antes que "IMG_001 (1).jpg"
+    for path, size in sorted(files, key=lambda f: (len(os.path.basename(f[0])), f[0])):
+        by_size.setdefault(size, []).append(path)
+    known_by_size = {}
+    for path, size, digest in known:
+        known_by_size.setdefault(size, []).append((path, digest))
+
+    candidates = [path for size, paths in by_size.items()
+                  if len(paths) > 1 or size in known_by_size for path in paths]
+    with ThreadPoolExecutor(HASH_THREADS) as pool:
+        hashed = dict(zip(candidates, pool.map(_digest_or_none, candidates)))
+    digests = {path: digest for path, digest in hashed.items() if digest is not None}
+
+    groups = []
+    for size, paths in by_size.items():
+        by_digest = {}
+        for path, digest in known_by_size.get(size, ()):
+            by_digest.setdefault(digest, [path])
+        for path in paths:
+            if path in digests:
+                by_digest.setdefault(digests[path], []).append(path)
+        groups.extend(group for group in by_digest.values() if len(group) > 1)
+    return groups, digests
+
+
+def _digest_or_none(path):
+    try:
+        return file_digest(path)
+    except OSError:
+        return None  # Ilegible: se comprime por su cuenta y allí dará el error
+
+
+def perceptual_hash(path, max_pixels=None):
+    """
+    (dHash de 64 bits, ancho, alto), o None si no se puede leer.
+
+    El dHash compara el brillo de píxeles vecinos en una miniatura de 9x8:
+    sobrevive a recompresiones y cambios de tamaño. En JPEG se decodifica
+    ya reducido (draft), así que casi no cuesta; pero solo hasta HASH_DRAFT
+    y la miniatura sale después de una media exacta (BOX) igual para todos
+    los formatos: si no, un PNG y su reexportación en JPEG se reducirían
+    por caminos distintos y sus hashes se separarían.
+    """
+    try:
+        with open_image(path, max_pixels) as img:
+            width, height = img.size
+            img.draft("L", (HASH_DRAFT, HASH_DRAFT))
+            small = img.convert("L").resize((9, 8), Image.Resampling.BOX)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    pixels = small.tobytes()
+    bits = 0
+    for y in range(8):
+        row = pixels[y * 9:(y + 1) * 9]
+        for x in range(8):
+            bits = (bits << 1) | (row[x] > row[x + 1])
+    return bits, width, height
+
+
+def perceptual_hashes(paths, max_pixels=None):
+    """perceptual_hash de varias rutas en paralelo: {ruta: (hash, ancho, alto)} de las legibles"""
+    with ThreadPoolExecutor(HASH_THREADS) as pool:
+        hashes = pool.map(lambda path: perceptual_hash(path, max_pixels), paths)
+        return {path: h for path, h in zip(paths, hashes) if h is not None}
+
+
+def near_groups(items, max_bits=NEAR_DUP_BITS):
+    """
+    Agrupa (ruta, hash, ancho, alto) casi iguales; cada ítem se compara solo
+    con representantes anteriores, así que el orden de `items` decide quién
+    representa a cada grupo. Devuelve solo los grupos de más de una ruta.
+
+    Para no comparar todos con todos, el hash se parte en max_bits + 1
+    bandas: dos hashes a max_bits o menos de distancia coinciden seguro en
+    alguna banda entera, así que basta con mirar a los que comparten alguna.
+    """
+    bands = max_bits + 1
+    edges = [round(i * 64 / bands) for i in range(bands + 1)]
+    masks = [(1 << (edges[i + 1] - edges[i])) - 1 for i in range(bands)]
+    index = [{} for _ in range(bands)]  # banda -> valor -> representantes
+    reps = {}  # representante -> (hash, proporción)
+    groups = {}
+
+    for path, bits, width, height in items:
+        ones = bin(bits).count("1")
+        if ones < MIN_HASH_BITS or ones > 64 - MIN_HASH_BITS:
+            continue
+        aspect = width / height
+        keys = [(bits >> edges[i]) & masks[i] for i in range(bands)]
+        match = None
+        for band, key in enumerate(keys):
+            for rep in index[band].get(key, ()):
+                rep_bits, rep_aspect = reps[rep]
+                if (bin(bits ^ rep_bits).count("1") <= max_bits
+                        and abs(aspect / rep_aspect - 1) <= ASPECT_TOLERANCE):
+                    match = rep
+                    break
+            if match is not None:
+                break
+        if match is not None:
+            groups[match].append(path)
+            continue
+        reps[path] = (bits, aspect)
+        groups[path] = [path]
+        for band, key in enumerate(keys):
+            index[band].setdefault(key, []).append(path)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def link_output(src, dst):
+    """
+    Hace que dst tenga el contenido de src: enlace duro si se puede, copia
+    si no (otro volumen, FAT...). Como write_atomic, pasa por un temporal y
+    un rename, y si luego se reescribe src el enlace no arrastra a dst.
+    Devuelve "link" o "copy".
+    """
+    tmp_path = f"{dst}.{os.getpid()}.tmp"
+    with suppress(FileNotFoundError):
+        os.remove(tmp_path)
+    try:
+        try:
+            os.link(src, tmp_path)
+            how = "link"
+        except OSError:
+            shutil.copyfile(src, tmp_path)
+            how = "copy"
+        os.replace(tmp_path, dst)
+    except BaseException:
+        with suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    return how
@@ -0,0 +1,1616 @@
+"""
+Motor de compresión de HYPER-SHRINK 3000.
+
+Busca la combinación calidad/escala que deja una imagen por debajo de un
+límite de bytes usando el menor número posible de codificaciones JPEG, y
+reparte los lotes de imágenes entre varios procesos.
+
+No importa Tk ni Qt: lo comparten las tres interfaces y ImgCompress_cli.py.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import suppress
+from dataclasses import dataclass, field
+
+from PIL import Image
+
+from ImgCompress_control import Cancelled, checkpoint, init_worker, use_control
+from ImgCompress_dedup import DEFAULT_DEDUP, exact_groups, link_output, near_groups, perceptual_hashes
+from ImgCompress_manifest import Manifest, data_digest, file_digest
+from ImgCompress_quality import PerceptualScorer, require as require_perceptual
+from ImgCompress_report import EventLog, RunReport, StageTimer
+from ImgCompress_scan import Preloaded, open_image, read_header, scan_images, stat_paths
+
+DEFAULT_TARGET_MB = 16
+DEFAULT_OUTPUT_NAME = "X-TREME_COMPRESSED"
+DEFAULT_SUFFIX = "_XTREME"
+MANIFEST_SAVE_EVERY = 25  # Guardar el manifiesto cada N imágenes comprimidas...
+MANIFEST_SAVE_INTERVAL_S = 30  # ...o cada tantos segundos: es el punto desde el que se reanuda
+CONTROL_POLL_S = 0.2      # Cada cuánto mira compress_batch si se pidió matar el pool
+CORRECTION_WINDOW = 16    # Imágenes recientes de las que se aprende la corrección del predictor
+DEFAULT_PREFETCH = 4      # Originales que se leen por adelantado mientras el pool codifica (0 = sin adelantar)
+IO_THREADS = 4            # Hilos que leen los originales y escriben las salidas
+PREFETCH_MEMORY_MB = 512  # Tope de originales en memoria a la vez; los que no caben los lee el proceso
+WARMUP_S = 0.2            # Lo que tarda cada tarea de arranque del pool: mientras, ningún proceso queda libre
+
+# --- PARÁMETROS DE BÚSQUEDA ---
+QUALITY_MAX = 95
+QUALITY_FLOOR = 70      # Por debajo de esta calidad preferimos reducir resolución
+QUALITY_MIN = 10
+SCALE_MIN = 0.1
+SCALE_STEP_MIN = 0.01   # Precisión mínima al bisecar la escala
+DEFAULT_TOLERANCE = 0.05  # Aceptamos quedar hasta un 5% por debajo del límite
+MAX_ATTEMPTS = 12
+MAX_CONFIRM = 4         # Codificaciones completas para confirmar la predicción antes de rendirse
+PERCEPTUAL_SCALES = (1.0, 0.9, 0.8, 0.7, 0.6, 0.5)  # Escalas que compara el modo perceptual
+
+# --- PREDICCIÓN DE TAMAÑO ---
+PREDICT_GRID = 3        # Recortes por lado del mosaico (3x3)
+PREDICT_TILE = 192      # Lado de cada recorte, en píxeles del candidato
+JPEG_MCU = 16           # Bloque mínimo de JPEG (8x8, 16x16 con el croma a la mitad)
+
+# --- DECODIFICACIÓN REDUCIDA (JPEG) ---
+DRAFT_MIN_PIXELS = 4_000_000  # Por debajo no compensa el sondeo previo
+DRAFT_MARGIN = 1.5            # Holgura del borrador sobre la escala estimada
+REDUCING_GAP = 3.0            # reduce() entero antes del LANCZOS final
+
+# --- MEMORIA ---
+# Pico aproximado por píxel decodificado: original, copia RGB, un nivel de la
+# pirámide y el remuestreo en curso (medido con ImgCompress_bench)
+PEAK_BYTES_PER_PIXEL = 10
+
+
+@dataclass
+class FileResult:
+    src: str
+    dst: str
+    original_size: int
+    size: int = 0
+    quality: int = 0
+    scale: float = 1.0
+    attempts: int = 0
+    error: str = ""
+    digest: str = ""
+    cached: bool = False
+    wall_s: float = 0.0
+    correction: float = 1.0  # Corrección del predictor de tamaño aprendida en esta imagen
+    codec: str = ""          # Formato escrito (ver CODECS)
+    cancelled: bool = False  # Interrumpida por BatchControl.cancel: ni éxito ni fallo
+    duplicate: str = ""      # "exact"/"near": no se comprimió, dst enlaza a la salida de duplicate_of
+    duplicate_of: str = ""
+    timings: dict = field(default_factory=dict)  # etapa -> [segundos de cada llamada]
+
+    @property
+    def ok(self):
+        return self.size > 0
+
+
+class EncodeBuffer:
+    """
+    Destino de escritura reutilizable para las codificaciones.
+
+    A diferencia de BytesIO (donde seek(0) + truncate(0) suelta la memoria y
+    cada intento vuelve a hacerla crecer), rewind() solo reinicia la posición:
+    la capacidad se conserva entre intentos y entre imágenes del mismo proceso.
+    """
+
+    def __init__(self, capacity=0):
+        self.data = bytearray(capacity)
+        self.size = 0
+
+    def reserve(self, capacity):
+        if capacity > len(self.data):
+            self.data.extend(bytes(capacity - len(self.data)))
+
+    def rewind(self):
+        self.size = 0
+
+    def write(self, chunk):
+        # Pillow escribe por bloques: pausar o cancelar no espera a que acabe la codificación
+        checkpoint()
+        end = self.size + len(chunk)
+        if end > len(self.data):
+            self.reserve(max(end, len(self.data) * 2))
+        self.data[self.size:end] = chunk
+        self.size = end
+        return len(chunk)
+
+    def tell(self):
+        return self.size
+
+    def flush(self):
+        pass
+
+    def getbuffer(self):
+        """Vista (sin copia) de lo escrito; hay que liberarla antes de volver a escribir"""
+        return memoryview(self.data)[:self.size]
+
+
+_local = threading.local()
+
+
+def _buffers():
+    """Par de EncodeBuffer (trabajo, mejor resultado) propio del hilo/proceso, reutilizado entre imágenes"""
+    if not hasattr(_local, "buffers"):
+        _local.buffers = [EncodeBuffer(), EncodeBuffer()]
+    return _local.buffers
+
+
+@dataclass
+class SearchResult:
+    buffer: EncodeBuffer
+    quality: int
+    scale: float
+    size: int
+    attempts: int
+    correction: float = 1.0
+    codec: str = "jpeg"
+
+
+def encode_jpeg(img, quality, buf, optimize=True, progressive=False):
+    """Codifica img en buf (un EncodeBuffer, reutilizado) y devuelve el tamaño en bytes"""
+    buf.rewind()
+    img.save(buf, "JPEG", quality=quality, optimize=optimize, progressive=progressive)
+    return buf.tell()
+
+
+ALPHA_MODES = ("RGBA", "LA", "PA")  # Modos con canal de transparencia
+JPEG_MODES = ("L", "RGB", "RGBA", "CMYK")  # RGBA se aplana al codificar
+
+
+@dataclass(frozen=True)
+class Codec:
+    """
+    Formato de salida: cómo se codifica y qué calidades recorre la búsqueda.
+
+    Los formatos sin pérdida tienen una sola calidad (quality_min ==
+    quality_max) y la búsqueda solo ajusta la escala. Con `palette` la imagen
+    se reduce a 256 colores antes de guardar (PNG de paleta). Sin `alpha`
+    (JPEG) una imagen con transparencia se aplana a RGB al codificarla.
+    """
+    name: str
+    format: str       # Nombre del formato en Pillow
+    extension: str
+    quality_min: int = QUALITY_MIN
+    quality_floor: int = QUALITY_FLOOR
+    quality_max: int = QUALITY_MAX
+    options: tuple = ()  # (clave, valor) extra para Image.save; pisan a quality
+    palette: bool = False
+    alpha: bool = True
+    modes: tuple = ("L", "RGB", "RGBA")  # Modos de trabajo que sabe codificar (ver _working_mode)
+
+    def accepts(self, mode):
+        return mode in self.modes
+
+    @property
+    def lossless(self):
+        return self.quality_min == self.quality_max
+
+    def encode(self, img, quality, buf):
+        """Codifica img en buf (un EncodeBuffer, reutilizado) y devuelve el tamaño en bytes"""
+        buf.rewind()
+        if not self.alpha and img.mode in ALPHA_MODES:
+            img = img.convert("RGB")
+        if self.palette:
+            img = img.quantize(256, method=Image.Quantize.FASTOCTREE)
+        img.save(buf, self.format, **{"quality": quality, **dict(self.options)})
+        return buf.tell()
+
+
+CODECS = {codec.name: codec for codec in (
+    Codec("jpeg", "JPEG", ".jpg", options=(("optimize", True),), alpha=False, modes=JPEG_MODES),
+    Codec("jpeg-progressive", "JPEG", ".jpg", options=(("optimize", True), ("progressive", True)), alpha=False,
+          modes=JPEG_MODES),
+    Codec("webp", "WEBP", ".webp", options=(("method", 4),)),
+    # En WebP sin pérdida quality es el esfuerzo de compresión, no la fidelidad
+    Codec("webp-lossless", "WEBP", ".webp", 100, 100, 100, (("lossless", True), ("quality", 50), ("method", 4))),
+    Codec("avif", "AVIF", ".avif", quality_floor=50, quality_max=90, options=(("speed", 8),)),
+    Codec("png", "PNG", ".png", 100, 100, 100, (("compress_level", 6),), palette=True),
+)}
+DEFAULT_FORMAT = "jpeg"
+# Candidatos de "auto", por orden de preferencia en caso de empate. AVIF no
+# entra: codificarlo cuesta ~25 veces más que JPEG y solo se usa si se pide.
+AUTO_CODECS = ("webp-lossless", "png", "jpeg", "webp")
+LOSSLESS_MAX_COLORS = 1 << 16  # Con más colores en el mosaico (una foto) "auto" ni prueba los sin pérdida
+OUTPUT_FORMATS = (*CODECS, "auto")
+
+
+def codecs_for(output_format):
+    """Tupla de Codec para un formato de salida (varios si es "auto"); ValueError si no existe"""
+    Image.init()
+    names = AUTO_CODECS if output_format == "auto" else (output_format,)
+    if any(name not in CODECS for name in names):
+        raise ValueError(f"formato de salida desconocido: {output_format}")
+    codecs = tuple(CODECS[name] for name in names if CODECS[name].format in Image.SAVE)
+    if not codecs:
+        raise ValueError(f"esta versión de Pillow no puede guardar {output_format}")
+    return codecs
+
+
+class ResizePyramid:
+    """
+    Caché de versiones reducidas de una imagen, indexadas por escala.
+
+    Cada escala nueva se obtiene del nivel ya calculado más cercano por encima
+    (o del original si no hay ninguno), así la búsqueda no paga un remuestreo a
+    resolución completa en cada intento. Los niveles más alejados de la última
+    escala pedida se descartan cuando la caché supera max_pixels.
+    """
+
+    def __init__(self, img, max_pixels=None, timer=None):
+        self.img = img
+        self.levels = {}
+        self.max_pixels = max_pixels if max_pixels is not None else img.width * img.height
+        self.timer = timer or StageTimer()
+
+    def get(self, scale):
+        if scale >= 1.0:
+            return self.img
+        if scale in self.levels:
+            return self.levels[scale]
+
+        source_scale = min((s for s in self.levels if s > scale), default=1.0)
+        source = self.levels.get(source_scale, self.img)
+        # Las dimensiones siempre se calculan sobre el original para no acumular redondeos
+        w = max(1, int(self.img.width * scale))
+        h = max(1, int(self.img.height * scale))
+        checkpoint()
+        with self.timer.stage("resize"):
+            level = source.resize((w, h), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+
+        self.levels[scale] = level
+        self._evict(scale)
+        return level
+
+    def _evict(self, keep):
+        def cached_pixels():
+            return sum(im.width * im.height for im in self.levels.values())
+
+        while len(self.levels) > 1 and cached_pixels() > self.max_pixels:
+            farthest = max((s for s in self.levels if s != keep), key=lambda s: abs(s - keep))
+            del self.levels[farthest]
+
+
+class SizePredictor:
+    """
+    Predice el tamaño final de una codificación sin codificar la imagen entera.
+
+    Codifica (con el mismo Codec que la versión final) un mosaico de
+    PREDICT_GRID x PREDICT_GRID recortes repartidos por el candidato y
+    extrapola por bytes por píxel. Como los recortes no representan la imagen
+    perfectamente, la extrapolación se multiplica por `correction`, que se
+    ajusta con cada codificación completa confirmada (learn). Si el candidato
+    no es mucho mayor que el mosaico se codifica entero y la predicción es exacta.
+    """
+
+    def __init__(self, pyramid, codec, correction=1.0, timer=None, proxies=None):
+        self.pyramid = pyramid
+        self.codec = codec
+        self.correction = correction
+        self.timer = timer or StageTimer()
+        # escala -> (imagen a codificar, factor de extrapolación o None si es exacta); se
+        # puede compartir entre predictores de varios formatos sobre la misma pirámide
+        self.proxies = {} if proxies is None else proxies
+        self.sizes = {}    # (calidad, escala) -> tamaño extrapolado sin corregir
+        self.buf = EncodeBuffer()
+
+    def proxy(self, scale):
+        """(imagen que se codifica para predecir a esta escala, factor de extrapolación o None si es exacta)"""
+        if scale in self.proxies:
+            return self.proxies[scale]
+        img = self.pyramid.img
+        pixels = max(1, int(img.width * min(scale, 1.0))) * max(1, int(img.height * min(scale, 1.0)))
+        side = PREDICT_GRID * PREDICT_TILE
+        if pixels <= 2 * side * side:
+            proxy = (self.pyramid.get(scale), None)
+        else:
+            # Cada recorte se toma a resolución original y se reduce solo: mucho más barato que reducir todo
+            cw = min(img.width // PREDICT_GRID, int(PREDICT_TILE / scale))
+            ch = min(img.height // PREDICT_GRID, int(PREDICT_TILE / scale))
+            tw, th = max(1, int(cw * scale)), max(1, int(ch * scale))
+            mosaic = Image.new(img.mode, (tw * PREDICT_GRID, th * PREDICT_GRID))
+            with self.timer.stage("predict"):
+                for row in range(PREDICT_GRID):
+                    for col in range(PREDICT_GRID):
+                        # Alineados a la rejilla de bloques JPEG: si el original es un JPEG, a escala
+                        # completa el mosaico se recuantiza igual que la imagen entera
+                        x = (int(img.width * (col + 0.5) / PREDICT_GRID) - cw // 2) // JPEG_MCU * JPEG_MCU
+                        y = (int(img.height * (row + 0.5) / PREDICT_GRID) - ch // 2) // JPEG_MCU * JPEG_MCU
+                        tile = img.crop((x, y, x + cw, y + ch))
+                        if (tw, th) != (cw, ch):
+                            tile = tile.resize((tw, th), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+                        mosaic.paste(tile, (col * tw, row * th))
+            proxy = (mosaic, pixels / (mosaic.width * mosaic.height))
+        self.proxies[scale] = proxy
+        return proxy
+
+    def predict(self, quality, scale):
+        key = (quality, scale)
+        image, factor = self.proxy(scale)
+        if key not in self.sizes:
+            with self.timer.stage("predict"):
+                size = self.codec.encode(image, quality, self.buf)
+            self.sizes[key] = size if factor is None else size * factor
+        if factor is None:
+            return self.sizes[key]
+        return int(self.sizes[key] * self.correction)
+
+    def learn(self, quality, scale, actual):
+        """Ajusta la corrección con el tamaño real de una combinación ya predicha"""
+        if self.proxies.get(scale, (None, None))[1] is not None and (quality, scale) in self.sizes:
+            self.correction = actual / self.sizes[(quality, scale)]
+
+
+def _interpolate(lo, hi, target, log_x=False):
+    """
+    Predice el x que produce `target` bytes a partir de dos muestras (x, tamaño):
+    `lo` cabe en el límite y `hi` no. El tamaño se modela en escala logarítmica.
+    """
+    (x0, s0), (x1, s1) = lo, hi
+    if log_x:
+        x0, x1 = math.log(x0), math.log(x1)
+    if s1 <= s0:
+        x = (x0 + x1) / 2
+    else:
+        t = (math.log(target) - math.log(s0)) / (math.log(s1) - math.log(s0))
+        x = x0 + (x1 - x0) * min(max(t, 0.0), 1.0)
+    return math.exp(x) if log_x else x
+
+
+def _choose(predict, codec, limit_bytes, tolerance, max_steps, hint=None, scale_min=SCALE_MIN):
+    """
+    Elige (calidad, escala) a partir de tamaños predichos, sin codificar la imagen.
+
+    Primero bisecta la calidad entre quality_floor y quality_max del codec a
+    tamaño completo; si ni siquiera quality_floor cabe, fija esa calidad y
+    bisecta la escala. Las muestras ya medidas se usan para predecir el
+    siguiente candidato y la búsqueda para en cuanto el resultado queda dentro
+    de `tolerance` del límite. Si nada cabe devuelve (quality_min, scale_min)
+    como último recurso.
+    """
+    goal = limit_bytes * (1 - tolerance / 2)
+    good_enough = limit_bytes * (1 - tolerance)
+    best = None  # (tamaño, calidad, escala) del mayor candidato que cabe
+    steps = 0
+
+    def attempt(quality, scale):
+        nonlocal best, steps
+        steps += 1
+        size = predict(quality, scale)
+        if size <= limit_bytes and (best is None or size > best[0]):
+            best = (size, quality, scale)
+        return size
+
+    def chosen():
+        return best[1:] if best is not None else (codec.quality_min, scale_min)
+
+    floor, top = codec.quality_floor, codec.quality_max
+    hint_quality, hint_scale = hint or (top, 1.0)
+    full_size = None  # Tamaño a calidad mínima preferida y escala completa, si se llegó a medir
+
+    # --- FASE 1: CALIDAD A TAMAÑO COMPLETO ---
+    if hint_scale >= 1.0:
+        lo = hi = None
+        quality = min(max(hint_quality, floor), top)
+        while steps < max_steps:
+            size = attempt(quality, 1.0)
+            if size <= limit_bytes:
+                if size >= good_enough or quality >= top:
+                    return chosen()
+                lo = (quality, size)
+            else:
+                hi = (quality, size)
+                if quality <= floor:
+                    full_size = size
+                    break  # Ni la calidad mínima preferida cabe: toca reducir resolución
+
+            if lo is None:
+                quality = floor
+            elif hi is None:
+                quality = top
+            elif hi[0] - lo[0] <= 1:
+                return chosen()
+            else:
+                quality = int(round(_interpolate(lo, hi, goal)))
+                quality = min(max(quality, lo[0] + 1), hi[0] - 1)
+
+        if best is not None:
+            return chosen()
+
+    # --- FASE 2: ESCALA CON CALIDAD FIJA ---
+    # El tamaño crece aproximadamente con el número de píxeles (escala²)
+    lo = None
+    if full_size is not None:
+        hi = (1.0, full_size)
+        scale = max(scale_min, math.sqrt(goal / full_size))
+    else:
+        hi = None
+        scale = max(scale_min, min(hint_scale, 1.0 - SCALE_STEP_MIN))
+    while steps < max_steps:
+        size = attempt(floor, scale)
+        if size <= limit_bytes:
+            if size >= good_enough:
+                return chosen()
+            lo = (scale, size)
+        else:
+            hi = (scale, size)
+
+        if lo is None:
+            if scale <= scale_min:
+                break
+            scale = max(scale_min, scale * math.sqrt(goal / size))
+            continue
+        upper = hi[0] if hi else 1.0
+        if upper - lo[0] < SCALE_STEP_MIN:
+            return chosen()
+        if hi is None:
+            scale = lo[0] * math.sqrt(goal / lo[1])
+        else:
+            scale = _interpolate(lo, hi, goal, log_x=True)
+        scale = min(max(scale, lo[0] + SCALE_STEP_MIN / 2), upper - SCALE_STEP_MIN / 2)
+
+    return chosen()
+
+
+def _max_quality(predict, codec, limit_bytes, scale, max_steps):
+    """Mayor calidad del codec que cabe a esta escala según la predicción, o None si ni la mínima cabe"""
+    top = (codec.quality_max, predict(codec.quality_max, scale))
+    if top[1] <= limit_bytes:
+        return top[0]
+    bottom = (codec.quality_min, predict(codec.quality_min, scale))
+    if bottom[1] > limit_bytes:
+        return None
+    lo, hi = bottom, top
+    for _ in range(max_steps):
+        if hi[0] - lo[0] <= 1:
+            break
+        quality = int(round(_interpolate(lo, hi, limit_bytes)))
+        quality = min(max(quality, lo[0] + 1), hi[0] - 1)
+        size = predict(quality, scale)
+        if size <= limit_bytes:
+            lo = (quality, size)
+        else:
+            hi = (quality, size)
+    return lo[0]
+
+
+def _choose_perceptual(max_quality, score, codec, scale_min=SCALE_MIN):
+    """
+    Elige (calidad, escala) por calidad visual en vez de por tamaño.
+
+    Recorre PERCEPTUAL_SCALES de mayor a menor; en cada una toma la mayor
+    calidad que cabe (max_quality, o None si ni la mínima cabe) y la puntúa
+    con `score` (SSIM, ver ImgCompress_quality). Al bajar la escala la
+    calidad que cabe sube, y la puntuación crece hasta que la pérdida de
+    detalle pesa más que los artefactos: en cuanto baja se para. Devuelve
+    None si nada cabe en ninguna de esas escalas.
+    """
+    best = None  # (puntuación, calidad, escala)
+    for scale in PERCEPTUAL_SCALES:
+        if scale < scale_min:
+            break
+        quality = max_quality(scale)
+        if quality is None:
+            continue
+        if best is None and quality >= codec.quality_max:
+            return quality, scale  # La mayor escala que cabe ya va a calidad máxima: no hay nada mejor
+        value = score(quality, scale)
+        if best is not None and value <= best[0]:
+            break
+        best = (value, quality, scale)
+        if quality >= codec.quality_max:
+            break  # Con menos resolución ya solo se pierde detalle
+    return best[1:] if best is not None else None
+
+
+def _pick_codec(img, predictors, limit_bytes, tolerance, max_steps, hint=None, scale_min=SCALE_MIN):
+    """
+    Elige el formato en modo "auto" solo con predicciones sobre el mosaico.
+
+    Un formato sin pérdida que cabe a tamaño completo gana directamente (el
+    PNG de paleta solo si la imagen ya tiene 256 colores o menos, para que
+    siga siendo sin pérdida). Si no, gana el que según _choose llega a más
+    escala y, a igual escala, a más calidad relativa a su propio rango.
+    Los sin pérdida solo se prueban con imágenes de pocos colores (capturas,
+    gráficos): en una foto nunca ganan y codificarlos es caro.
+    """
+    best_key = best = None
+    proxy, _ = predictors[0].proxy(1.0)
+    few_colors = proxy.getcolors(LOSSLESS_MAX_COLORS) is not None
+    for predictor in predictors:
+        codec = predictor.codec
+        if not codec.accepts(img.mode):
+            continue
+        if codec.lossless:
+            if not few_colors or (codec.palette and img.getcolors(256) is None):
+                continue
+            if predictor.predict(codec.quality_max, 1.0) <= limit_bytes:
+                return predictor
+            continue
+        quality, scale = _choose(predictor.predict, codec, limit_bytes, tolerance, max_steps, hint, scale_min)
+        key = (scale, (quality - codec.quality_floor) / (codec.quality_max - codec.quality_floor))
+        if best_key is None or key > best_key:
+            best_key, best = key, predictor
+    return best or next((p for p in predictors if p.codec.accepts(img.mode)), predictors[0])
+
+
+def search_target(img, limit_bytes, tolerance=DEFAULT_TOLERANCE, max_attempts=MAX_ATTEMPTS, hint=None,
+                  timer=None, codecs=(CODECS[DEFAULT_FORMAT],), correction=1.0, memory_budget=None,
+                  perceptual=False, base_scale=1.0):
+    """
+    Busca la calidad (y después la escala) que deja img por debajo de limit_bytes.
+
+    La búsqueda (_choose) trabaja sobre tamaños predichos por SizePredictor;
+    solo la combinación elegida se codifica entera para confirmarla contra
+    el límite. Con varios `codecs` (modo "auto") antes se elige el formato
+    con _pick_codec y el resultado dice cuál ganó (codec). Si la
+    predicción se desvía, el error real ajusta la corrección del predictor y
+    se vuelve a elegir, hasta MAX_CONFIRM codificaciones completas. Devuelve
+    un SearchResult (con la corrección aprendida) o None si la imagen no se
+    puede reducir.
+
+    `hint` es un (calidad, escala) encontrado antes para esta imagen y se usa
+    como primer candidato. Una escala < 1 implica que la calidad mínima
+    preferida no cabe a tamaño completo, así que solo debe pasarse si el
+    límite no ha crecido.
+    `correction` es el factor de corrección de partida (el aprendido en la
+    pasada, ver BatchRun). Con `memory_budget` (bytes) la caché de la
+    pirámide se limita a lo que queda del presupuesto tras la propia imagen.
+
+    Con `perceptual` (necesita NumPy) los formatos con pérdida eligen entre
+    varias escalas la combinación que mejor se ve según SSIM, aunque eso
+    signifique bajar de QUALITY_FLOOR a tamaño completo (ver
+    _choose_perceptual). `hint` no se usa en ese modo.
+
+    `base_scale` es la escala de img respecto al original (un borrador JPEG
+    ya viene reducido): SCALE_MIN se aplica sobre el original, no sobre img.
+
+    Si se pasa un StageTimer, cada codificación y redimensionado queda medido.
+
+    El buffer del SearchResult es uno de los EncodeBuffer del hilo (ver
+    _buffers): hay que consumirlo antes de la siguiente búsqueda.
+    """
+    timer = timer or StageTimer()
+    good_enough = limit_bytes * (1 - tolerance)
+    scale_min = min(1.0, SCALE_MIN / base_scale)
+    cache_pixels = None  # Píxeles RGB que caben en el presupuesto, descontando la imagen y el remuestreo en curso
+    if memory_budget:
+        cache_pixels = max(0, memory_budget // 3 - img.width * img.height * 2)
+    pyramid = ResizePyramid(img, max_pixels=cache_pixels, timer=timer)
+    proxies = {}
+    predictors = [SizePredictor(pyramid, codec, correction, timer, proxies) for codec in codecs]
+    if len(predictors) == 1:
+        predictor = predictors[0]
+    else:
+        predictor = _pick_codec(img, predictors, limit_bytes, tolerance, max_attempts, hint, scale_min)
+    codec = predictor.codec
+    buffers = _buffers()
+    for buf in buffers:
+        buf.reserve(limit_bytes)
+    best = None
+    tried = {}  # (calidad, escala) -> tamaño real
+    attempts = 0
+    goal = limit_bytes * (1 - tolerance / 2)
+
+    if perceptual and not codec.lossless:
+        scorer = PerceptualScorer(img, codec, EncodeBuffer(), timer)
+
+        def quality_at(scale):
+            """Mayor calidad que cabe a esta escala: la predicha, acotada por lo ya codificado entero"""
+            # La corrección aprendida en una calidad no vale igual en otra: las medidas reales mandan
+            measured = [(q, size) for (q, s), size in tried.items() if s == scale]
+            lo = max((m for m in measured if m[1] <= limit_bytes), default=None)
+            hi = min((m for m in measured if m[1] > limit_bytes), default=None)
+            if lo is not None and hi is not None:
+                if hi[0] - lo[0] <= 1:
+                    return lo[0]
+                quality = int(round(_interpolate(lo, hi, goal)))
+            else:
+                quality = _max_quality(predictor.predict, codec, limit_bytes, scale, max_attempts)
+                if quality is None:
+                    return None if lo is None else lo[0]
+            if lo is not None:
+                quality = max(quality, min(lo[0] + 1, codec.quality_max))
+            if hi is not None:
+                if hi[0] <= codec.quality_min:
+                    return None
+                quality = min(quality, hi[0] - 1)
+            return quality
+
+        def choose():
+            return (_choose_perceptual(quality_at, scorer.score, codec, scale_min)
+                    or _choose(predictor.predict, codec, limit_bytes, tolerance, max_attempts, scale_min=scale_min))
+
+        def rank(quality, scale, size):
+            return scorer.score(quality, scale), size
+    else:
+        def choose():
+            return _choose(predictor.predict, codec, limit_bytes, tolerance, max_attempts, hint, scale_min)
+
+        def rank(quality, scale, size):
+            return size
+
+    def confirm(quality, scale):
+        """Codificación completa: devuelve el tamaño real y guarda la mejor que cabe (según rank)"""
+        nonlocal best, attempts
+        attempts += 1
+        # Se codifica en el buffer libre; si gana, intercambia el papel con el del mejor
+        work = buffers[0] if best is None or best.buffer is buffers[1] else buffers[1]
+        with timer.stage("encode"):
+            size = codec.encode(pyramid.get(scale), quality, work)
+        if size <= limit_bytes and (best is None or rank(quality, scale, size)
+                                    > rank(best.quality, best.scale, best.size)):
+            best = SearchResult(work, quality, scale, size, attempts)
+        return size
+
+    choice = choose()
+    while attempts < MAX_CONFIRM and choice not in tried:
+        quality, scale = choice
+        size = tried[choice] = confirm(quality, scale)
+        if best is not None and (best.size >= good_enough or (best.quality >= codec.quality_max
+                                                              and best.scale >= 1.0)):
+            break
+        predictor.learn(quality, scale, size)
+        choice = choose()
+
+    # --- ÚLTIMO RECURSO: la predicción nunca cupo, bajamos a partir del tamaño real ---
+    while best is None and attempts < max_attempts:
+        if scale >= 1.0 and quality > codec.quality_floor:
+            quality -= 1
+        elif scale > scale_min:
+            scale = max(scale_min, scale * min(0.99, math.sqrt(goal / size)))
+        elif quality > codec.quality_min:
+            quality = codec.quality_min
+        else:
+            break
+        size = confirm(quality, scale)
+
+    if best is None:
+        return None
+    best.attempts = attempts
+    best.correction = predictor.correction
+    best.codec = codec.name
+    return best
+
+
+# --- DECODIFICACIÓN ---
+
+def memory_estimate(width, height, factor=1):
+    """Bytes de pico estimados para comprimir una imagen decodificada a 1/factor"""
+    return (width // factor) * (height // factor) * PEAK_BYTES_PER_PIXEL
+
+
+def budget_factor(width, height, fmt, memory_budget):
+    """
+    Menor fracción (1, 2, 4 u 8) a la que hay que decodificar para no pasar de
+    memory_budget bytes. Solo los JPEG se pueden decodificar reducidos; el
+    resto se queda en 1 y BatchRun los limita por concurrencia.
+    """
+    factor = 1
+    if memory_budget and fmt == "JPEG":
+        while factor < 8 and memory_estimate(width, height, factor) > memory_budget:
+            factor *= 2
+    return factor
+
+
+def draft_factor(path, limit_bytes, max_pixels=None):
+    """
+    Estima a qué fracción (1, 2, 4 u 8) se puede decodificar un JPEG sin perder
+    resolución útil. Decodifica un borrador a 1/8 (escalado DCT, casi gratis),
+    lo codifica a QUALITY_FLOOR y extrapola el tamaño a resolución completa.
+    """
+    with open_image(path, max_pixels) as probe:
+        w, h = probe.size
+        if probe.format != "JPEG" or w * h < DRAFT_MIN_PIXELS:
+            return 1
+        probe.draft(None, (max(1, w // 8), max(1, h // 8)))
+        size = encode_jpeg(probe, QUALITY_FLOOR, EncodeBuffer())
+        estimated = size * (w * h) / (probe.width * probe.height)
+
+    scale = math.sqrt(limit_bytes / estimated)
+    factor = 1
+    while factor < 8 and 1 / (factor * 2) >= scale * DRAFT_MARGIN:
+        factor *= 2
+    return factor
+
+
+def _working_mode(img, codecs):
+    """
+    Modo en el que se busca: L, RGB o RGBA (o CMYK si todos los formatos lo
+    aceptan). RGBA solo si la imagen tiene transparencia real y algún
+    formato la conserva (en "auto" solo el candidato JPEG la aplana, ver
+    Codec.encode). Las paletas se expanden siempre para poder remuestrear,
+    y el PNG las vuelve a crear al codificar; las imágenes de 1, 16 o 32
+    bits y las de coma flotante pasan a L (ver _convert).
+    """
+    if img.mode == "P":
+        transparent = "transparency" in img.info
+    elif img.mode in ALPHA_MODES:
+        # Un canal alfa todo opaco (exportaciones RGBA de fotos) solo añadiría bytes
+        transparent = img.getchannel("A").getextrema()[0] < 255
+    elif img.mode == "CMYK":
+        return img.mode if all(c.accepts("CMYK") for c in codecs) else "RGB"
+    elif img.mode in ("L", "RGB"):
+        return img.mode
+    elif img.mode in ("1", "I", "F") or img.mode.startswith("I;16"):
+        return "L"
+    else:
+        return "RGB"  # YCbCr, LAB, HSV...
+    return "RGBA" if transparent and any(c.alpha for c in codecs) else "RGB"
+
+
+def _convert(img, mode):
+    """
+    img.convert(mode), pero las imágenes de 16 o 32 bits y las de coma
+    flotante se reescalan a 8 bits: convert solo recorta, y un PNG de 16
+    bits saldría casi blanco. Los flotantes en [0, 1] se toman como tales.
+    """
+    if img.mode.startswith("I;16"):
+        img = img.convert("I")
+    if img.mode in ("I", "F"):
+        _, high = img.getextrema()
+        if high > 255:
+            img = img.point(lambda v: v * (255 / max(high, 65535)))
+        elif img.mode == "F" and high <= 1.0:
+            img = img.point(lambda v: v * 255)
+    return img.convert(mode)
+
+
+def _search_file(path, limit_bytes, factor=1, hint=None, timer=None, correction=1.0,
+                 memory_budget=None, max_pixels=None, codecs=(CODECS[DEFAULT_FORMAT],), perceptual=False):
+    """Abre path (como borrador 1/factor si es JPEG) y busca. Devuelve (SearchResult, escala base)"""
+    timer = timer or StageTimer()
+    with open_image(path, max_pixels) as img:
+        full_width = img.width
+        with timer.stage("decode"):
+            if factor > 1:
+                img.draft(None, (img.width // factor, img.height // factor))
+            img.load()
+        base_scale = img.width / full_width
+        if hint is not None:
+            # La escala del hint es relativa al original, no al borrador
+            quality, scale = hint
+            hint = (quality, 1.0) if scale >= 1.0 else (quality, scale / base_scale)
+            if hint[1] >= 1.0:
+                hint = None
+        mode = _working_mode(img, codecs)
+        if mode != img.mode:
+            with timer.stage("convert"):
+                converted = _convert(img, mode)
+            img.close()  # Suelta ya el original: no hace falta tener las dos copias a la vez
+            img = converted
+        return search_target(img, limit_bytes, hint=hint, timer=timer, codecs=codecs, correction=correction,
+                             memory_budget=memory_budget, perceptual=perceptual, base_scale=base_scale), base_scale
+
+
+# --- ESCRITURA ---
+
+def write_atomic(path, data):
+    """
+    Escribe data en un temporal junto a path y lo renombra encima: nadie ve
+    nunca un archivo a medias con el nombre final, ni siquiera si el proceso
+    muere a mitad de la escritura.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+def write_result(result, data):
+    """
+    Escribe en result.dst la salida que devolvió encode_file (con data None
+    no hay nada que escribir) y suma el tiempo a su etapa write. Si falla,
+    result queda con el error, como si hubiera fallado la compresión.
+    """
+    if data is None:
+        return result
+    start = time.perf_counter()
+    try:
+        write_atomic(result.dst, data)
+    except OSError as e:
+        result.size = 0
+        result.error = str(e)
+    elapsed = time.perf_counter() - start
+    result.timings.setdefault("write", []).append(elapsed)
+    result.wall_s += elapsed
+    return result
+
+
+def fsync_paths(paths):
+    """
+    Fuerza a disco los archivos de paths y después sus carpetas (para que el
+    rename de write_atomic también sobreviva a un corte de luz). Se hace por
+    lotes desde BatchRun: en volúmenes de red un fsync por archivo cuesta caro.
+    """
+    folders = set()
+    for path in paths:
+        with suppress(OSError):
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            folders.add(os.path.dirname(path))
+    for folder in folders:
+        with suppress(OSError):  # Windows no deja abrir carpetas
+            fd = os.open(folder, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+
+# --- PROCESAMIENTO POR LOTES ---
+
+def compress_file(src, dst, limit_bytes, hint=None, with_digest=False, memory_budget=None, max_pixels=None,
+                  output_format=DEFAULT_FORMAT, correction=1.0, perceptual=False):
+    """
+    Comprime un archivo y escribe el resultado en dst. Se ejecuta en los procesos del pool.
+    Es encode_file seguido de write_result; los argumentos son los mismos.
+    """
+    return write_result(*encode_file(src, dst, limit_bytes, hint, with_digest, memory_budget, max_pixels,
+                                     output_format, correction, perceptual))
+
+
+def encode_file(src, dst, limit_bytes, hint=None, with_digest=False, memory_budget=None, max_pixels=None,
+                output_format=DEFAULT_FORMAT, correction=1.0, perceptual=False, source=None):
+    """
+    La parte de compress_file que usa la CPU: devuelve (FileResult, bytes de
+    la salida o None si no hay nada que escribir) sin tocar dst. Con
+    `source` (el contenido de src ya leído, ver IOStages) tampoco lee src.
+
+    `hint` es el (calidad, escala) de una pasada anterior; con `with_digest`
+    se calcula además el hash del original para el manifiesto. `correction`
+    es la corrección de partida del predictor de tamaño (ver SizePredictor).
+
+    `memory_budget` (bytes) obliga a decodificar los JPEG reducidos si a
+    tamaño completo no caben y limita la caché de la pirámide; `max_pixels`
+    sustituye el límite anti-"decompression bomb" de Pillow (ver open_image).
+
+    `output_format` es un nombre de CODECS o "auto". La extensión de dst se
+    cambia por la del formato escrito, y FileResult.dst/codec lo reflejan.
+    `perceptual` activa la elección por SSIM (ver search_target).
+    """
+    result = FileResult(src, dst, 0)
+    timer = StageTimer()
+    start = time.perf_counter()
+    output = None
+
+    def opened():
+        # Cada lectura necesita su propio archivo: el contenido en memoria se envuelve de nuevo
+        return src if source is None else Preloaded(source, src)
+
+    try:
+        checkpoint()
+        if source is None:
+            result.original_size = os.path.getsize(src)
+        else:
+            result.original_size = len(source)
+        if with_digest:
+            with timer.stage("hash"):
+                result.digest = file_digest(src) if source is None else data_digest(source)
+        codecs = codecs_for(output_format)
+        with timer.stage("probe"):
+            width, height, _, fmt = read_header(opened(), max_pixels)
+            floor = budget_factor(width, height, fmt, memory_budget)
+            factor = max(floor, draft_factor(opened(), limit_bytes, max_pixels))
+        found, base_scale = _search_file(opened(), limit_bytes, factor, hint, timer, correction, memory_budget,
+                                         max_pixels, codecs, perceptual)
+        if found is not None and factor > floor and found.scale >= 1.0:
+            # El borrador cabía sin reducir: la estimación se quedó corta, repetimos con más resolución.
+            # Si a resolución completa no hay salida que quepa, nos quedamos con la del borrador
+            retry, retry_scale = _search_file(opened(), limit_bytes, floor, hint, timer, found.correction,
+                                              memory_budget, max_pixels, codecs, perceptual)
+            if retry is not None:
+                retry.attempts += found.attempts
+                found, base_scale = retry, retry_scale
+
+        if found is not None:
+            result.codec = found.codec
+            result.dst = os.path.splitext(dst)[0] + CODECS[found.codec].extension
+            with found.buffer.getbuffer() as data:
+                output = bytes(data)
+            result.size = found.size
+            result.quality = found.quality
+            result.scale = found.scale * base_scale
+            result.attempts = found.attempts
+            result.correction = found.correction
+        # found None sin error: imposible de reducir
+    except Cancelled:
+        result.cancelled = True
+    except Exception as e:
+        result.error = str(e)
+    result.wall_s = time.perf_counter() - start
+    result.timings = timer.stages
+    return result, output
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def _terminate(pool):
+    """Mata los procesos del pool sin esperar a que terminen su imagen"""
+    terminate = getattr(pool, "terminate_workers", None)  # Python 3.14+
+    if terminate is not None:
+        terminate()
+        return
+    for process in list((pool._processes or {}).values()):
+        process.terminate()
+
+
+class IOStages:
+    """
+    Etapas de E/S alrededor del pool de compress_batch, en hilos propios.
+
+    items() lee por adelantado el contenido de los próximos `depth`
+    originales mientras los procesos codifican, y write() encola las
+    salidas que devuelven para escribirlas mientras siguen con la
+    siguiente: en carpetas de red (NFS, SMB) la latencia de cada lectura y
+    escritura deja de parar la CPU. Las dos colas están acotadas: como mucho
+    `depth` lecturas adelantadas y `depth` escrituras pendientes (ver full),
+    y nunca más de `max_bytes` de originales en memoria; un original que no
+    cabe (o que no se puede leer) se entrega sin contenido y lo lee el
+    proceso como siempre, que es también quien informa del error.
+    """
+
+    def __init__(self, jobs, depth, max_bytes=PREFETCH_MEMORY_MB * 1024 * 1024, threads=IO_THREADS):
+        self.jobs = jobs
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self.loaded = 0  # Bytes de originales leídos que siguen en memoria
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(threads)
+        self.writes = set()  # Futuros de write_result aún sin entregar
+
+    def _read(self, path):
+        try:
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if not self._reserve(size):
+                    return None
+                try:
+                    data = f.read()
+                except OSError:
+                    self._add(-size)
+                    raise
+        except OSError:
+            return None
+        self._add(len(data) - size)  # Por si el archivo cambió de tamaño entre fstat y read
+        return data
+
+    def _reserve(self, size):
+        with self.lock:
+            if self.loaded + size > self.max_bytes:
+                return False
+            self.loaded += size
+            return True
+
+    def _add(self, size):
+        with self.lock:
+            self.loaded += size
+
+    def release(self, source):
+        """Libera del tope el contenido de un trabajo que ya terminó"""
+        if source is not None:
+            self._add(-len(source))
+
+    def items(self):
+        """Los trabajos de jobs, en orden, como (trabajo, contenido del original o None)"""
+        reads = deque()
+        try:
+            for job in self.jobs:
+                reads.append((job, None if job is None else self.pool.submit(self._read, job[0])))
+                if len(reads) > self.depth:
+                    job, future = reads.popleft()
+                    yield job, None if future is None else future.result()
+            while reads:
+                job, future = reads.popleft()
+                yield job, None if future is None else future.result()
+        finally:
+            # Lo adelantado que ya no se va a entregar
+            for _, future in reads:
+                if future is not None and not future.cancel():
+                    self.release(future.result())
+
+    def write(self, result, data):
+        self.writes.add(self.pool.submit(write_result, result, data))
+
+    @property
+    def full(self):
+        return len(self.writes) >= self.depth
+
+    def written(self, block=False):
+        """FileResult de las escrituras terminadas; con block espera al menos a una"""
+        if block and self.writes:
+            wait(self.writes, return_when=FIRST_COMPLETED)
+        for future in [future for future in self.writes if future.done()]:
+            self.writes.remove(future)
+            yield future.result()
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _spawn_workers(pool, workers):
+    """
+    Crea ya todos los procesos del pool, antes de arrancar los hilos de
+    IOStages. El pool los bifurca en el primer submit: con los hilos en
+    marcha, un proceso podría nacer con el lock de un hilo (el de Pillow,
+    el de un archivo a medio leer) tomado para siempre. Cada tarea de
+    arranque espera un poco para que ningún proceso quede libre y se
+    reutilice (en Python < 3.11 se crea uno por submit sin proceso libre).
+    """
+    wait([pool.submit(time.sleep, WARMUP_S) for _ in range(workers)])
+
+
+def compress_batch(jobs, workers=None, max_in_flight=None, memory_of=None, memory_limit=None, control=None,
+                   prefetch=0):
+    """
+    Comprime una lista de trabajos en paralelo. Cada trabajo es la tupla de
+    argumentos de compress_file: (src, dst, limit_bytes[, hint, with_digest, ...]).
+    Un trabajo None no se envía: se devuelve None en su lugar, para que quien
+    alimenta la cola de forma perezosa pueda dar paso a sus propios eventos.
+
+    Es un generador que devuelve cada FileResult en cuanto termina, en orden de
+    finalización. Nunca hay más de `max_in_flight` imágenes encoladas en el
+    pool (por defecto el doble de procesos), así la memoria queda acotada
+    aunque la carpeta tenga miles de archivos. Si quien consume el generador
+    lo abandona, los trabajos pendientes se cancelan.
+
+    Con `memory_of` (trabajo -> bytes estimados) y `memory_limit`, un trabajo
+    espera a que terminen otros si no cabe junto a los que ya están en el
+    pool; uno que no cabe ni solo se envía cuando el pool queda vacío.
+
+    Con `prefetch` > 0 la lectura y la escritura se solapan con la
+    codificación (ver IOStages): los procesos reciben el original ya leído
+    y devuelven la salida en memoria (encode_file), y cada FileResult se
+    entrega cuando su salida ya está en disco.
+
+    Con un BatchControl (ver ImgCompress_control), al cancelar no se envía
+    nada más, lo encolado se descarta y lo que está en marcha para en su
+    siguiente checkpoint (su FileResult llega con cancelled). Con kill los
+    procesos se terminan sin esperar.
+    """
+    workers = workers or default_workers()
+    if workers == 1:
+        # Sin pool: evitamos el coste de arrancar procesos
+        stages = IOStages(iter(jobs), prefetch) if prefetch else None
+        items = stages.items() if stages else ((job, None) for job in jobs)
+        use_control(control)
+        try:
+            for job, source in items:
+                if control is not None and control.cancelled:
+                    break
+                if job is None:
+                    yield None
+                elif stages is None:
+                    yield compress_file(*job)
+                else:
+                    stages.write(*encode_file(*job, source=source))
+                    stages.release(source)
+                    yield from stages.written(block=stages.full)
+            while stages is not None and stages.writes:
+                yield from stages.written(block=True)
+        finally:
+            use_control(None)
+            items.close()
+            if stages is not None:
+                stages.close()
+        return
+
+    max_in_flight = max_in_flight or workers * 2
+    initargs = (control,) if control is not None else ()
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker if control else None, initargs=initargs)
+    if prefetch:
+        _spawn_workers(pool, workers)
+    stages = IOStages(iter(jobs), prefetch) if prefetch else None
+    items = stages.items() if stages else ((job, None) for job in jobs)
+    pending = {}  # futuro -> (memoria estimada, original en memoria)
+    in_use = 0
+    held = None  # (trabajo, original) que espera a que se libere memoria
+    stopping = False
+    try:
+        while True:
+            if control is not None and control.cancelled:
+                if control.kill:
+                    break
+                if not stopping:
+                    stopping = True
+                    items.close()  # Un generador cerrado ya no entrega nada más
+                    held = None
+                    for future in pending:
+                        future.cancel()  # Solo afecta a los que aún no han empezado
+            # Si las escrituras van atrasadas no se envía más: así la cola de salidas no crece sin límite
+            while len(pending) < max_in_flight and not (stages is not None and stages.full):
+                if held is not None:
+                    item, held = held, None
+                else:
+                    item = next(items, StopIteration)
+                if item is StopIteration:
+                    break
+                job, source = item
+                if job is None:
+                    yield None
+                    continue
+                need = memory_of(job) if memory_of else 0
+                if pending and memory_limit and in_use + need > memory_limit:
+                    held = item
+                    break
+                if stages is None:
+                    future = pool.submit(compress_file, *job)
+                else:
+                    future = pool.submit(encode_file, *job, source=source)
+                pending[future] = (need, source)
+                in_use += need
+            writes = stages.writes if stages is not None else set()
+            if not pending and not writes:
+                break
+            timeout = CONTROL_POLL_S if control else None
+            done, _ = wait(pending.keys() | writes, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future not in pending:
+                    continue  # Escritura: la recoge written()
+                need, source = pending.pop(future)
+                in_use -= need
+                if future.cancelled():
+                    pass
+                elif stages is None:
+                    yield future.result()
+                else:
+                    stages.write(*future.result())
+                if stages is not None:
+                    stages.release(source)
+            if stages is not None:
+                yield from stages.written()
+    finally:
+        items.close()
+        if control is not None and control.kill:
+            _terminate(pool)
+        pool.shutdown(wait=True, cancel_futures=True)
+        if stages is not None:
+            stages.close()
+
+
+def format_eta(seconds):
+    """Segundos restantes como m:ss (o h:mm:ss); '--:--' si aún no hay estimación"""
+    if seconds is None:
+        return "--:--"
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+
+class BatchRun:
+    """
+    Estado de una pasada de run_batch: recorrido, plan, progreso y manifiesto.
+
+    Los eventos que surgen durante el recorrido (cacheadas, errores) se dejan
+    en `self.events` y se entregan intercalados con los resultados del pool.
+    Con `paths` no se recorre folder: se procesan solo esas rutas (las que
+    ImgCompress_watch ve llegar), con el mismo manifiesto y la misma salida.
+
+    Con `dedup` (ver ImgCompress_dedup) las repetidas se apartan al
+    planificar: `followers` guarda, por representante, las que recibirán un
+    enlace a su salida cuando termine.
+
+    Dos originales nunca comparten salida (ver output_path): `claimed`
+    guarda qué original ocupa cada nombre, con los del manifiesto incluidos.
+    """
+
+    def __init__(self, folder, target_mb, output_folder, suffix, workers, recursive,
+                 use_manifest, include, exclude, mirror, plan, event_log=None, fsync_every=0,
+                 memory_mb=None, max_megapixels=None, output_format=DEFAULT_FORMAT, control=None, paths=None,
+                 dedup=DEFAULT_DEDUP, perceptual=False, prefetch=DEFAULT_PREFETCH):
+        if perceptual:
+            require_perceptual()
+        self.folder = folder
+        self.paths = paths
+        self.dedup = dedup if plan else "off"  # Sin plan no se sabe qué se repite hasta haberlo comprimido
+        self.followers = {}  # representante -> [(ruta, dst, tipo, hash)]
+        self.duplicates = 0
+        self.limit_bytes = int(target_mb * 1024 * 1024)
+        self.output_folder = output_folder or os.path.join(folder, DEFAULT_OUTPUT_NAME)
+        self.suffix = suffix
+        self.output_format = output_format
+        self.perceptual = perceptual
+        self.control = control
+        # En "auto" la extensión provisional es .jpg; compress_file la cambia por la del formato elegido
+        self.extension = codecs_for(output_format)[0].extension if output_format != "auto" else ".jpg"
+        self.workers = workers
+        self.recursive = recursive
+        self.include = include
+        self.exclude = exclude
+        self.mirror = mirror
+        self.plan = plan
+        self.fsync_every = fsync_every
+        self.prefetch = prefetch
+        self.unsynced = []  # Salidas escritas pendientes del siguiente fsync por lotes
+        self.memory_budget = int(memory_mb * 1024 * 1024) if memory_mb else None  # Por proceso
+        self.max_pixels = int(max_megapixels * 1e6) if max_megapixels else None
+
+        os.makedirs(self.output_folder, exist_ok=True)
+        self.manifest = Manifest.for_output(self.output_folder) if use_manifest else None
+        self.created_dirs = {self.output_folder}
+        self.claimed = {}  # Ruta de salida sin extensión (normalizada) -> original que la ocupa
+        if self.manifest is not None:
+            # Lo ya comprimido conserva su nombre aunque en esta pasada aparezca antes otro homónimo
+            owners = {}
+            for src, record in self.manifest.files.items():
+                owners.setdefault(self._stem_key(record["dst"]), []).append(src)
+            # Un nombre que reclaman varios registros (salidas que se pisaron) no es de ninguno:
+            # se reparte de nuevo en orden de recorrido y is_done mira qué salida quedó en disco
+            self.claimed = {key: srcs[0] for key, srcs in owners.items() if len(srcs) == 1}
+
+        self.events = deque()
+        self.stats = {}
+        self.costs = {}  # Megapíxeles de cada trabajo pendiente
+        self.memory = {}  # Bytes de pico estimados de cada trabajo pendiente
+        self.total = self.done = self.jobs = self.count = 0
+        self.work_total = self.work_done = 0.0
+        self.started = self.saved = time.monotonic()
+        self.report = RunReport()
+        self.corrections = deque(maxlen=CORRECTION_WINDOW)
+        self.event_log = EventLog(event_log) if event_log else None
+
+    @staticmethod
+    def _stem_key(path):
+        # Sin extensión: en "auto" la decide el formato ganador, y a.jpg y a.png no pueden compartir salida
+        return os.path.normcase(os.path.splitext(os.path.abspath(path))[0])
+
+    def output_path(self, path):
+        """
+        Salida de path: nombre + sufijo (+ _2, _3... si otro original ya
+        ocupa ese nombre, p.ej. homónimos de subcarpetas distintas sin
+        `mirror`, o foto.jpg y foto.png). El recorrido va en orden
+        alfabético y el manifiesto recuerda los nombres dados, así que cada
+        original recibe el mismo en todas las pasadas.
+        """
+        out_dir = self.output_folder
+        if self.mirror:
+            rel_dir = os.path.relpath(os.path.dirname(path), self.folder)
+            out_dir = os.path.normpath(os.path.join(self.output_folder, rel_dir))
+            if out_dir not in self.created_dirs:
+                os.makedirs(out_dir, exist_ok=True)
+                self.created_dirs.add(out_dir)
+        base = os.path.join(out_dir, f"{os.path.splitext(os.path.basename(path))[0]}{self.suffix}")
+        src = os.path.abspath(path)
+        stem, n = base, 1
+        while self.claimed.setdefault(self._stem_key(stem), src) != src:
+            n += 1
+            stem = f"{base}_{n}"
+        return stem + self.extension
+
+    def progress(self):
+        """Progreso ponderado por megapíxeles (0-100) y segundos restantes estimados (o None)"""
+        if self.work_total > 0:
+            percent = 100.0 * self.work_done / self.work_total
+        else:
+            percent = 100.0 * self.done / self.total if self.total else 0.0
+        eta = None
+        if self.work_done > 0:
+            elapsed = time.monotonic() - self.started
+            eta = elapsed * (self.work_total - self.work_done) / self.work_done
+        return {"done": self.done, "total": self.total, "percent": percent, "eta": eta}
+
+    def _skip(self, event):
+        self.done += 1
+        if event is not None:
+            event.update(self.progress())
+            self.events.append(event)
+
+    def discover(self, announce=True):
+        """
+        Generador de trabajos (con su coste en MP) en el orden en que aparecen
+        en disco. Sin `announce` el evento scan_done lo pone quien llama.
+        """
+        if self.paths is None:
+            sources = scan_images(self.folder, self.recursive, self.include, self.exclude,
+                                  skip_dirs=[self.output_folder])
+        else:
+            sources = stat_paths(self.paths)
+        for path, st in sources:
+            if self.control is not None and self.control.cancelled:
+                break
+            self.total += 1
+            if st.st_size <= self.limit_bytes:
+                self._skip(None)  # Ya es pequeña
+                continue
+            try:
+                dst = self.output_path(path)
+                hint = None
+                record = self.manifest.lookup(path, st) if self.manifest else None
+                if record is not None:
+                    if self.manifest.is_done(record, dst, self.limit_bytes, self.output_format,
+                                             self.perceptual):
+                        cached = FileResult(path, record["dst"], st.st_size, record["out_size"], record["quality"],
+                                            record["scale"], digest=record["digest"], cached=True,
+                                            codec=record.get("codec", DEFAULT_FORMAT))
+                        self._skip({"type": "cached", "result": cached})
+                        yield None
+                        continue
+                    hint = Manifest.hint_for(record, self.limit_bytes, self.output_format)
+                # Solo la cabecera: dimensiones sin decodificar un solo píxel
+                width, height, _, fmt = read_header(path, self.max_pixels)
+            except (OSError, Image.DecompressionBombError) as e:
+                self._skip({"type": "error", "src": path, "error": str(e)})
+                yield None
+                continue
+
+            cost = width * height / 1e6
+            self.stats[path] = st
+            self.costs[path] = cost
+            self.memory[path] = memory_estimate(width, height,
+                                                budget_factor(width, height, fmt, self.memory_budget))
+            self.jobs += 1
+            self.work_total += cost
+            yield (path, dst, self.limit_bytes, hint, self.manifest is not None, self.memory_budget,
+                   self.max_pixels, self.output_format)
+        if announce:
+            self._scan_done()
+
+    def _scan_done(self):
+        self.events.append({"type": "scan_done", "total": self.total, "jobs": self.jobs,
+                            "megapixels": self.work_total, "duplicates": self.duplicates})
+
+    def planned(self):
+        """Recorre todo primero y entrega los trabajos de mayor a menor coste"""
+        jobs = []
+        for job in self.discover(announce=False):
+            if job is None:
+                yield None
+            else:
+                jobs.append(job)
+        if self.dedup != "off":
+            jobs = self._deduplicate(jobs)
+        self._scan_done()
+        # Las imágenes grandes primero: así ningún proceso se queda solo con una enorme al final
+        jobs.sort(key=lambda job: self.costs[job[0]], reverse=True)
+        yield from jobs
+
+    def _deduplicate(self, jobs):
+        """Aparta las repetidas (ver ImgCompress_dedup) y devuelve solo los trabajos a comprimir"""
+        dsts = {job[0]: job[1] for job in jobs}
+        outputs = self._known_outputs(exclude={os.path.abspath(path) for path in dsts})
+        known = [(r.src, r.original_size, r.digest) for r in outputs.values()]
+        groups, digests = exact_groups([(path, self.stats[path].st_size) for path in dsts], known)
+        for group in groups:
+            for path in group[1:]:
+                self._follow(group[0], path, dsts[path], "exact", digests.get(path, ""))
+
+        if self.dedup == "near":
+            remaining = [path for path in dsts if path in self.costs]
+            hashes = perceptual_hashes(remaining, self.max_pixels)
+            # La de más píxeles representa al grupo: las demás salen de ella sin perder detalle
+            items = sorted(((path, *hashes[path]) for path in remaining if path in hashes),
+                           key=lambda item: item[2] * item[3], reverse=True)
+            for group in near_groups(items):
+                for path in group[1:]:
+                    self._follow(group[0], path, dsts[path], "near", "")
+
+        # Copias de algo comprimido en una pasada anterior: se enlazan ya a esa salida
+        for src in [src for src in self.followers if src in outputs]:
+            self.events.extend(self._link_followers(outputs[src]))
+        return [job for job in jobs if job[0] in self.costs]
+
+    def _known_outputs(self, exclude=()):
+        """
+        {original: FileResult} de lo que el manifiesto ya comprimió con este
+        límite y formato y cuya salida sigue ahí; así una copia que llega
+        más tarde (o en modo vigilancia) se enlaza sin volver a comprimir.
+        """
+        if self.manifest is None:
+            return {}
+        outputs = {}
+        for src, record in self.manifest.files.items():
+            if (src in exclude or not record.get("digest") or record["limit_bytes"] != self.limit_bytes
+                    or record.get("format", DEFAULT_FORMAT) != self.output_format
+                    or not Manifest.output_intact(record)):
+                continue
+            outputs[src] = FileResult(src, record["dst"], record["size"], record["out_size"], record["quality"],
+                                      record["scale"], digest=record["digest"], cached=True,
+                                      codec=record.get("codec", DEFAULT_FORMAT))
+        return outputs
+
+    def _follow(self, rep, path, dst, kind, digest):
+        self.followers.setdefault(rep, []).append((path, dst, kind, digest))
+        self.work_total -= self.costs.pop(path)
+        self.memory.pop(path)
+        self.jobs -= 1
+        self.duplicates += 1
+
+    def _drop_followers(self, src):
+        """Las repetidas de una imagen cancelada quedan pendientes para la próxima pasada"""
+        for path, *_ in self.followers.pop(src, ()):
+            self.stats.pop(path)
+
+    def _link_followers(self, result):
+        """Eventos file de las repetidas de result, ya enlazadas a su salida"""
+        for path, dst, kind, digest in self.followers.pop(result.src, ()):
+            st = self.stats.pop(path)
+            # En "auto" la extensión la decide el formato que ganó el representante
+            dst = os.path.splitext(dst)[0] + os.path.splitext(result.dst)[1]
+            follower = FileResult(path, dst, st.st_size, error=result.error, codec=result.codec,
+                                  digest=digest or (result.digest if kind == "exact" else ""),
+                                  duplicate=kind, duplicate_of=result.src)
+            if result.ok:
+                try:
+                    link_output(result.dst, dst)
+                    follower.size, follower.quality, follower.scale = result.size, result.quality, result.scale
+                except OSError as e:
+                    follower.error = str(e)
+            self.done += 1
+            self.count += follower.ok
+            self.report.add_duplicate(kind)
+            if follower.ok:
+                if self.fsync_every:
+                    self.unsynced.append(dst)
+                if self.manifest is not None:
+                    self.manifest.record(follower, st, self.limit_bytes, self.output_format, self.perceptual)
+            yield {"type": "file", "result": follower, **self.progress()}
+
+    def correction(self):
+        """Mediana de las correcciones del predictor en las últimas imágenes (1.0 al principio)"""
+        if not self.corrections:
+            return 1.0
+        return sorted(self.corrections)[len(self.corrections) // 2]
+
+    def _with_correction(self, jobs):
+        """Completa cada trabajo con la corrección aprendida hasta el momento de enviarlo al pool"""
+        for job in jobs:
+            yield None if job is None else (*job, self.correction(), self.perceptual)
+
+    def _sync(self):
+        if self.unsynced:
+            fsync_paths(self.unsynced)
+            self.unsynced.clear()
+
+    def _emit(self, event):
+        if self.event_log is not None:
+            self.event_log.write(event)
+        return event
+
+    def run(self):
+        yield self._emit({"type": "start", "output": self.output_folder, "limit_bytes": self.limit_bytes})
+
+        jobs = self.planned() if self.plan else self.discover()
+        try:
+            memory_limit = None
+            if self.memory_budget:
+                # Presupuesto total del pool: las imágenes grandes esperan turno en vez de coincidir
+                memory_limit = self.memory_budget * (self.workers or default_workers())
+            for result in compress_batch(self._with_correction(jobs), self.workers,
+                                         memory_of=lambda job: self.memory[job[0]], memory_limit=memory_limit,
+                                         control=self.control, prefetch=self.prefetch):
+                while self.events:
+                    yield self._emit(self.events.popleft())
+                if result is None:
+                    continue
+                if result.cancelled:
+                    # Ni hecha ni fallida: la próxima pasada la vuelve a intentar
+                    self.costs.pop(result.src)
+                    self.memory.pop(result.src)
+                    self.stats.pop(result.src)
+                    self._drop_followers(result.src)
+                    continue
+
+                self.done += 1
+                self.count += result.ok
+                self.work_done += self.costs.pop(result.src)
+                self.memory.pop(result.src)
+                self.report.add(result)
+                if result.ok:
+                    self.corrections.append(result.correction)
+                    if self.fsync_every:
+                        self.unsynced.append(result.dst)
+                        if len(self.unsynced) >= self.fsync_every:
+                            self._sync()
+                st = self.stats.pop(result.src)
+                if self.manifest is not None and result.ok:
+                    self.manifest.record(result, st, self.limit_bytes, self.output_format, self.perceptual)
+                    if (self.count % MANIFEST_SAVE_EVERY == 0
+                            or time.monotonic() - self.saved > MANIFEST_SAVE_INTERVAL_S):
+                        self.manifest.save()
+                        self.saved = time.monotonic()
+                yield self._emit({"type": "file", "result": result, **self.progress()})
+                for event in self._link_followers(result):
+                    yield self._emit(event)
+            while self.events:
+                yield self._emit(self.events.popleft())
+
+            cancelled = self.control is not None and self.control.cancelled
+            yield self._emit({"type": "end", "count": self.count, "output": self.output_folder,
+                              "cancelled": cancelled, "report": self.report.summary(), **self.progress()})
+        finally:
+            self._sync()
+            if self.manifest is not None:
+                self.manifest.save()
+            if self.event_log is not None:
+                self.event_log.close()
+
+
+def run_batch(folder, target_mb=DEFAULT_TARGET_MB, output_folder=None, suffix=DEFAULT_SUFFIX,
+              workers=None, recursive=False, use_manifest=True, include=(), exclude=(), mirror=False,
+              plan=True, event_log=None, fsync_every=0, memory_mb=None, max_megapixels=None,
+              output_format=DEFAULT_FORMAT, control=None, dedup=DEFAULT_DEDUP, perceptual=False,
+              prefetch=DEFAULT_PREFETCH):
+    """
+    Comprime todas las imágenes de folder que superan target_mb.
+
+    Es un generador de eventos (diccionarios con una clave "type") que las
+    interfaces traducen a su propio log y barra de progreso:
+
+      start      output                -> empieza el recorrido
+      error      src, error            -> no se pudo leer el archivo
+      cached     result                -> ya comprimida en una pasada anterior
+      file       result                -> FileResult de una imagen terminada
+      scan_done  total, jobs, megapixels, duplicates -> recorrido completo
+      end        count, output, report, cancelled -> resumen final (ver ImgCompress_report)
+
+    Los eventos error/cached/file/end llevan además el progreso: done y total
+    (archivos), percent (ponderado por megapíxeles, no por número de
+    archivos) y eta (segundos restantes estimados, o None).
+
+    Con `plan` se leen primero las cabeceras de todas las imágenes (sin
+    decodificarlas) y se comprimen de mayor a menor, que reparte mejor la
+    carga entre procesos. Sin `plan` las imágenes se comprimen en cuanto se
+    descubren (ver ImgCompress_scan), así que los totales solo son
+    definitivos a partir de scan_done. Con `recursive` se bajan las
+    subcarpetas y con `mirror` la salida replica su estructura;
+    `include`/`exclude` son globs.
+
+    Cada FileResult trae los tiempos de cada etapa (timings) y `report`
+    los resume con percentiles. Con `event_log` todos los eventos se
+    escriben además como JSON-lines en ese archivo.
+
+    `output_format` es uno de OUTPUT_FORMATS: un formato fijo de CODECS o
+    "auto", que elige por imagen (ver _pick_codec). FileResult.codec dice
+    cuál se escribió y dst lleva su extensión.
+
+    Cada salida se escribe en un temporal y se renombra (write_atomic). Con
+    `fsync_every` > 0 las salidas se fuerzan a disco cada tantas imágenes y
+    al terminar; sin él se deja en manos del sistema operativo. Mientras los
+    procesos codifican, unos hilos leen los `prefetch` originales siguientes
+    y escriben las salidas ya terminadas (ver IOStages): en carpetas de red
+    la CPU no espera al disco. Con 0 cada proceso lee y escribe lo suyo.
+
+    Con `memory_mb` cada proceso trabaja dentro de ese presupuesto: los JPEG
+    que no caben se decodifican reducidos y el resto de imágenes grandes se
+    reparten para no coincidir en el pool (ver compress_batch).
+    `max_megapixels` sustituye el límite anti-"decompression bomb" de Pillow;
+    las imágenes que lo superan dan un evento error.
+
+    Con `use_manifest` los resultados se recuerdan en el manifiesto de la
+    carpeta de salida (ver ImgCompress_manifest). Si quien lo consume deja de
+    iterar, el pool se cancela y el manifiesto se guarda igualmente.
+
+    `control` es un BatchControl (ver ImgCompress_control) para pausar o
+    cancelar desde otro hilo. Al cancelar, las imágenes a medias se descartan
+    sin evento, la pasada termina con un end con cancelled=True y, como el
+    manifiesto recuerda lo ya hecho, relanzarla continúa donde se quedó.
+
+    `dedup` ("off", "exact" o "near", ver ImgCompress_dedup) comprime una sola
+    vez cada imagen repetida: las demás copias dan un evento file cuyo
+    FileResult lleva duplicate/duplicate_of y cuyo dst es un enlace duro a la
+    salida del representante. "exact" también reconoce copias de imágenes ya
+    comprimidas según el manifiesto. Solo actúa con `plan`.
+
+    Con `perceptual` cada imagen se queda con la calidad/escala que mejor se
+    ve según SSIM bajo el límite, en vez de con la de mayor calidad a la
+    mayor escala (ver search_target). Necesita NumPy: sin él da ValueError.
+    """
+    batch = BatchRun(folder, target_mb, output_folder, suffix, workers, recursive,
+                     use_manifest, include, exclude, mirror, plan, event_log, fsync_every,
+                     memory_mb, max_megapixels, output_format, control, dedup=dedup, perceptual=perceptual,
+                     prefetch=prefetch)
+    yield from batch.run()
@@ -0,0 +1,124 @@
+"""
+Manifiesto persistente de resultados de HYPER-SHRINK 3000.
+
+Se guarda como JSON dentro de la carpeta de salida y recuerda, por cada
+original, su tamaño, mtime y hash junto con el límite usado y la
+calidad/escala ganadoras. Así una segunda pasada sobre la misma carpeta
+salta al instante lo que no ha cambiado, y si cambia el límite la búsqueda
+arranca desde los parámetros ya conocidos.
+"""
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = ".hypershrink_manifest.json"
+MANIFEST_VERSION = 1
+LEGACY_FORMAT = "jpeg"  # Los registros sin "format" son de cuando solo se escribía JPEG
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """Hash del contenido (BLAKE2b) leyendo por bloques"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def data_digest(data):
+    """El mismo hash que file_digest, de un contenido ya leído en memoria"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class Manifest:
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        self.dirty = False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.files = data.get("files", {})
+        except (OSError, ValueError):
+            pass  # Sin manifiesto (o corrupto): empezamos de cero
+
+    @classmethod
+    def for_output(cls, output_folder):
+        return cls(os.path.join(output_folder, MANIFEST_NAME))
+
+    def lookup(self, src, st):
+        """
+        Devuelve el registro de src si el archivo no ha cambiado, o None.
+
+        Si tamaño y mtime coinciden se da por bueno sin leer el archivo; si
+        solo coincide el tamaño se compara el hash (p.ej. una copia o un
+        `touch`) y, si es el mismo contenido, se actualiza el mtime guardado.
+        """
+        record = self.files.get(os.path.abspath(src))
+        if record is None or record["size"] != st.st_size:
+            return None
+        if record["mtime_ns"] != st.st_mtime_ns:
+            if file_digest(src) != record["digest"]:
+                return None
+            record["mtime_ns"] = st.st_mtime_ns
+            self.dirty = True
+        return record
+
+    def is_done(self, record, dst, limit_bytes, output_format=LEGACY_FORMAT, perceptual=False):
+        """
+        True si el registro ya produjo dst con este mismo límite, formato y
+        modo (perceptual o no) y esa salida sigue intacta. Solo se compara dst
+        sin extensión: en modo "auto" la extensión depende del formato que ganó.
+        """
+        return (record["limit_bytes"] == limit_bytes
+                and record.get("format", LEGACY_FORMAT) == output_format
+                and record.get("perceptual", False) == perceptual
+                and os.path.splitext(record["dst"])[0] == os.path.splitext(os.path.abspath(dst))[0]
+                and self.output_intact(record))
+
+    @staticmethod
+    def output_intact(record):
+        """
+        True si la salida del registro existe y mide lo que se escribió: si
+        otra imagen (o alguien) la ha sobrescrito, ya no es de este original.
+        """
+        try:
+            return os.path.getsize(record["dst"]) == record["out_size"]
+        except OSError:
+            return False
+
+    @staticmethod
+    def hint_for(record, limit_bytes, output_format=LEGACY_FORMAT):
+        """(calidad, escala) de partida para un límite nuevo, o None si no sirve"""
+        if record.get("format", LEGACY_FORMAT) != output_format:
+            return None  # La calidad de otro formato no dice nada de este
+        if record["scale"] < 1.0 and limit_bytes > record["limit_bytes"]:
+            return None  # Con más margen quizá ya no haga falta reducir resolución
+        return record["quality"], record["scale"]
+
+    def record(self, result, st, limit_bytes, output_format=LEGACY_FORMAT, perceptual=False):
+        self.files[os.path.abspath(result.src)] = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "digest": result.digest,
+            "limit_bytes": limit_bytes,
+            "format": output_format,
+            "perceptual": perceptual,
+            "codec": result.codec,
+            "dst": os.path.abspath(result.dst),
+            "out_size": result.size,
+            "quality": result.quality,
+            "scale": result.scale,
+        }
+        self.dirty = True
+
+    def save(self):
+        """Escritura atómica: un corte a mitad nunca deja un manifiesto a medias"""
+        if not self.dirty:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
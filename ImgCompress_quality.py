@@ -0,0 +1,158 @@
+"""
+Medida de calidad visual para el modo perceptual de HYPER-SHRINK 3000.
+
+La búsqueda normal solo mira bytes: baja la calidad hasta QUALITY_FLOOR y,
+si no basta, reduce resolución, aunque a veces una calidad menor a tamaño
+completo se vería mejor con los mismos bytes. En modo perceptual cada
+candidato (calidad, escala) se puntúa con SSIM sobre la luminancia de un
+mosaico de recortes a resolución original: el candidato se reduce, se
+codifica, se decodifica y se vuelve a ampliar para compararlo con el
+original. Ver _choose_perceptual en ImgCompress_engine.
+
+Necesita NumPy (opcional: sin él el resto del programa funciona igual).
+"""
+import io
+
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:  # Sin NumPy no hay modo perceptual
+    np = None
+
+SSIM_WINDOW = 7        # Lado de la ventana de medias locales, en píxeles
+SSIM_K1, SSIM_K2 = 0.01, 0.03
+PROBE_GRID = 3         # Recortes por lado del mosaico de referencia (3x3)
+PROBE_TILE = 128       # Lado de cada recorte, en píxeles del original
+JPEG_MCU = 16          # Bloque mínimo de JPEG (8x8, 16x16 con el croma a la mitad)
+
+
+def available():
+    return np is not None
+
+
+def require():
+    """ValueError si falta NumPy: se llama al configurar la pasada, no a mitad"""
+    if np is None:
+        raise ValueError("el modo perceptual necesita NumPy (pip install numpy)")
+
+
+def _luma(img):
+    if img.mode not in ("L", "RGB"):
+        img = img.convert("RGB")  # CMYK, I;16... no pasan directamente a L
+    return np.asarray(img.convert("L"), dtype=np.float64)
+
+
+def _local_mean(a, k):
+    """Media de cada ventana k x k (solo las completas) con una imagen integral: O(1) por píxel"""
+    c = np.zeros((a.shape[0] + 1, a.shape[1] + 1))
+    c[1:, 1:] = a.cumsum(0).cumsum(1)
+    return (c[k:, k:] - c[:-k, k:] - c[k:, :-k] + c[:-k, :-k]) / (k * k)
+
+
+def ssim(a, b, window=SSIM_WINDOW):
+    """
+    SSIM medio entre dos imágenes del mismo tamaño (1.0 = idénticas), sobre
+    la luminancia y con ventanas uniformes. Todo son operaciones de array:
+    un mosaico de 384x384 se mide en unos pocos milisegundos.
+    """
+    x, y = _luma(a), _luma(b)
+    k = min(window, *x.shape)
+    c1, c2 = (SSIM_K1 * 255) ** 2, (SSIM_K2 * 255) ** 2
+    mx, my = _local_mean(x, k), _local_mean(y, k)
+    vx = _local_mean(x * x, k) - mx * mx
+    vy = _local_mean(y * y, k) - my * my
+    cov = _local_mean(x * y, k) - mx * my
+    index = (2 * mx * my + c1) * (2 * cov + c2) / ((mx * mx + my * my + c1) * (vx + vy + c2))
+    return float(index.mean())
+
+
+def probe_boxes(width, height):
+    """
+    Recortes (x0, y0, x1, y1) del mosaico de referencia: PROBE_GRID x
+    PROBE_GRID de hasta PROBE_TILE píxeles repartidos por la imagen, o None
+    si es pequeña y se compara entera. Van alineados a la rejilla de bloques
+    JPEG: si el original es un JPEG, el mosaico se recuantiza igual que la
+    imagen entera (como en SizePredictor).
+    """
+    side = PROBE_GRID * PROBE_TILE
+    if width * height <= 2 * side * side:
+        return None
+    tw, th = min(PROBE_TILE, width // PROBE_GRID), min(PROBE_TILE, height // PROBE_GRID)
+    boxes = []
+    for row in range(PROBE_GRID):
+        for col in range(PROBE_GRID):
+            x = (int(width * (col + 0.5) / PROBE_GRID) - tw // 2) // JPEG_MCU * JPEG_MCU
+            y = (int(height * (row + 0.5) / PROBE_GRID) - th // 2) // JPEG_MCU * JPEG_MCU
+            boxes.append((x, y, x + tw, y + th))
+    return boxes
+
+
+def mosaic(img, boxes, source_size=None):
+    """
+    Junta en una imagen los recortes `boxes` de img. Si img es una versión
+    reducida de otra de tamaño source_size, las cajas están en coordenadas
+    de esa otra y cada recorte se amplía solo hasta su tamaño en ella.
+    """
+    tw, th = boxes[0][2] - boxes[0][0], boxes[0][3] - boxes[0][1]
+    joined = Image.new(img.mode, (tw * PROBE_GRID, th * PROBE_GRID))
+    for i, box in enumerate(boxes):
+        if source_size is None:
+            tile = img.crop(box)
+        else:
+            sx, sy = img.width / source_size[0], img.height / source_size[1]
+            tile = img.resize((tw, th), Image.Resampling.BICUBIC,
+                              box=(box[0] * sx, box[1] * sy, box[2] * sx, box[3] * sy))
+        joined.paste(tile, ((i % PROBE_GRID) * tw, (i // PROBE_GRID) * th))
+    return joined
+
+
+def output_ssim(original, output):
+    """
+    SSIM de una salida (quizá reducida) frente a su original, sobre el mismo
+    mosaico que PerceptualScorer: el coste no crece con los megapíxeles.
+    """
+    original, output = (im if im.mode in ("L", "RGB") else im.convert("RGB") for im in (original, output))
+    boxes = probe_boxes(original.width, original.height)
+    if boxes is None:
+        return ssim(original, output.resize(original.size, Image.Resampling.BICUBIC))
+    return ssim(mosaic(original, boxes), mosaic(output, boxes, original.size))
+
+
+class PerceptualScorer:
+    """
+    Puntúa (calidad, escala) para un Codec sin codificar la imagen entera.
+
+    La referencia es un mosaico de PROBE_GRID x PROBE_GRID recortes a
+    resolución original (o la imagen entera si es pequeña): así la pérdida
+    de detalle al reducir se ve igual que los artefactos de la calidad, cosa
+    que no pasaría comparando miniaturas. Las puntuaciones se guardan: la
+    búsqueda vuelve a pedir las mismas al reelegir tras una confirmación.
+    """
+
+    def __init__(self, img, codec, buf, timer):
+        require()
+        self.codec = codec
+        self.buf = buf
+        self.timer = timer
+        boxes = probe_boxes(img.width, img.height)
+        self.reference = img if boxes is None else mosaic(img, boxes)
+        self.scores = {}  # (calidad, escala) -> SSIM
+
+    def score(self, quality, scale):
+        key = (quality, scale)
+        if key not in self.scores:
+            ref = self.reference
+            with self.timer.stage("perceptual"):
+                candidate = ref
+                if scale < 1.0:
+                    size = (max(1, int(ref.width * scale)), max(1, int(ref.height * scale)))
+                    candidate = ref.resize(size, Image.Resampling.LANCZOS)
+                self.codec.encode(candidate, quality, self.buf)
+                with self.buf.getbuffer() as data:
+                    decoded = Image.open(io.BytesIO(data))
+                    decoded.load()
+                if decoded.size != ref.size:
+                    decoded = decoded.resize(ref.size, Image.Resampling.BICUBIC)
+                self.scores[key] = ssim(ref, decoded)
+        return self.scores[key]
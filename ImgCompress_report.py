@@ -0,0 +1,136 @@
+"""
+Instrumentación e informe de ejecución de HYPER-SHRINK 3000.
+
+StageTimer mide cada etapa de una imagen (decodificación, conversión,
+redimensionado, cada codificación, escritura...). RunReport junta los
+tiempos de todas las imágenes de una pasada y los resume con percentiles, y
+EventLog guarda los eventos de run_batch como JSON-lines.
+"""
+import json
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, is_dataclass
+
+# Orden en el que se muestran las etapas en el resumen
+STAGES = ("hash", "probe", "decode", "convert", "resize", "predict", "encode", "write")
+
+
+class StageTimer:
+    """Acumula las duraciones (segundos) de cada etapa; una lista por etapa"""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.setdefault(name, []).append(time.perf_counter() - start)
+
+
+def percentile(values, p):
+    """Percentil p (0-100) con interpolación lineal; None si no hay valores"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def _distribution(values):
+    return {"p50": percentile(values, 50), "p90": percentile(values, 90), "p99": percentile(values, 99),
+            "max": max(values) if values else None}
+
+
+class RunReport:
+    """Resumen de una pasada: tiempo por etapa, percentiles por imagen e intentos"""
+
+    def __init__(self):
+        self.files = 0
+        self.failed = 0
+        self.walls = []
+        self.attempts = []
+        self.stage_files = {}  # etapa -> [segundos por imagen]
+        self.stage_calls = {}  # etapa -> número de llamadas
+        self.duplicates = {"exact": 0, "near": 0}  # Repetidas enlazadas en vez de comprimidas
+
+    def add(self, result):
+        self.files += 1
+        self.failed += not result.ok
+        self.walls.append(result.wall_s)
+        self.attempts.append(result.attempts)
+        for name, durations in result.timings.items():
+            self.stage_files.setdefault(name, []).append(sum(durations))
+            self.stage_calls[name] = self.stage_calls.get(name, 0) + len(durations)
+
+    def add_duplicate(self, kind):
+        self.duplicates[kind] += 1
+
+    def summary(self):
+        stage_total = sum(sum(v) for v in self.stage_files.values())
+        stages = {}
+        for name in sorted(self.stage_files, key=lambda n: STAGES.index(n) if n in STAGES else len(STAGES)):
+            per_file = self.stage_files[name]
+            stages[name] = {
+                "calls": self.stage_calls[name],
+                "total_s": sum(per_file),
+                "share": sum(per_file) / stage_total if stage_total else 0.0,
+                **_distribution(per_file),
+            }
+        return {
+            "files": self.files,
+            "failed": self.failed,
+            "wall_s": _distribution(self.walls),
+            "attempts": {"total": sum(self.attempts),
+                         "mean": sum(self.attempts) / len(self.attempts) if self.attempts else None,
+                         **_distribution(self.attempts)},
+            "stages": stages,
+            "duplicates": dict(self.duplicates),
+        }
+
+
+def format_report(summary):
+    """Líneas de texto del resumen, para el log de las GUIs y la consola"""
+    lines = []
+    duplicates = summary.get("duplicates", {})
+    if any(duplicates.values()):
+        lines.append(f"DUPLICATES: {sum(duplicates.values())} LINKED, NOT RE-ENCODED "
+                     f"({duplicates['exact']} EXACT, {duplicates['near']} NEAR)")
+    if not summary["files"]:
+        return lines
+    wall = summary["wall_s"]
+    attempts = summary["attempts"]
+    lines[:0] = [
+        f"FILES: {summary['files']} ({summary['failed']} FAILED)  "
+        f"TIME/FILE p50 {wall['p50']:.2f}s p90 {wall['p90']:.2f}s p99 {wall['p99']:.2f}s",
+        f"ENCODES: {attempts['total']} (MEAN {attempts['mean']:.1f}/FILE, p90 {attempts['p90']:.0f})",
+    ]
+    for name, stage in summary["stages"].items():
+        lines.append(f"  {name.upper():<10}{stage['share'] * 100:5.1f}%  {stage['total_s']:8.2f}s  "
+                     f"{stage['calls']:>5} CALLS  p50 {stage['p50']:.3f}s p90 {stage['p90']:.3f}s")
+    return lines
+
+
+def _jsonable(value):
+    if is_dataclass(value):
+        return asdict(value)
+    raise TypeError(f"{type(value).__name__} no es serializable")
+
+
+class EventLog:
+    """Escribe cada evento de run_batch como una línea JSON (con marca de tiempo)"""
+
+    def __init__(self, path):
+        self.file = open(path, "a", encoding="utf-8")
+
+    def write(self, event):
+        record = {"ts": time.time(), **event}
+        self.file.write(json.dumps(record, default=_jsonable) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
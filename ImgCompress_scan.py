@@ -0,0 +1,142 @@
+"""
+Descubrimiento de imágenes para HYPER-SHRINK 3000.
+
+Recorre la carpeta con os.scandir y va entregando cada imagen en cuanto la
+encuentra, junto con su stat, para que la compresión empiece sin esperar a
+que termine el recorrido completo del árbol. read_header permite planificar
+el trabajo (megapíxeles por imagen) sin decodificar nada.
+"""
+import fnmatch
+import io
+import os
+import stat
+
+from PIL import Image
+
+VALID_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.tiff', '.bmp')
+
+
+def _matches(rel_path, patterns):
+    """Un patrón glob vale tanto contra la ruta relativa (a/b.png) como contra el nombre"""
+    name = rel_path.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatch(rel_path, p) or fnmatch.fnmatch(name, p) for p in patterns)
+
+
+def scan_images(folder, recursive=False, include=(), exclude=(), skip_dirs=()):
+    """
+    Generador de (ruta, stat) para cada imagen de folder.
+
+    - include: si se indica, solo se aceptan archivos que casen con algún glob.
+    - exclude: globs de archivos o carpetas a ignorar (las carpetas no se recorren).
+    - skip_dirs: rutas que nunca se recorren (p.ej. la carpeta de salida).
+
+    El stat de cada DirEntry se reutiliza, así que no hace falta un
+    os.path.getsize aparte por archivo. El orden es alfabético dentro de cada
+    carpeta y en profundidad entre carpetas.
+    """
+    skip_dirs = {os.path.abspath(p) for p in skip_dirs}
+    pending = [(folder, "")]
+
+    while pending:
+        current, rel_dir = pending.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue  # Carpeta ilegible o borrada mientras recorríamos
+
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}{entry.name}"
+            try:
+                if entry.is_dir():
+                    if (recursive and os.path.abspath(entry.path) not in skip_dirs
+                            and not _matches(rel_path, exclude)):
+                        subdirs.append((entry.path, rel_path + "/"))
+                    continue
+                if not entry.is_file() or not entry.name.lower().endswith(VALID_EXTENSIONS):
+                    continue
+                if include and not _matches(rel_path, include):
+                    continue
+                if exclude and _matches(rel_path, exclude):
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+            yield entry.path, st
+
+        # Al revés porque la pila saca primero el último
+        pending.extend(reversed(subdirs))
+
+
+def accepts(rel_path, recursive=False, include=(), exclude=()):
+    """
+    True si scan_images entregaría rel_path (relativa a la carpeta, con /)
+    con estas opciones. Sirve para filtrar rutas sueltas, como las que
+    notifica ImgCompress_watch, sin recorrer la carpeta.
+    """
+    parts = rel_path.split("/")
+    if len(parts) > 1 and not recursive:
+        return False
+    if any(_matches("/".join(parts[:i]), exclude) for i in range(1, len(parts))):
+        return False  # Dentro de una carpeta excluida
+    if not parts[-1].lower().endswith(VALID_EXTENSIONS):
+        return False
+    if include and not _matches(rel_path, include):
+        return False
+    return not (exclude and _matches(rel_path, exclude))
+
+
+def stat_paths(paths):
+    """Generador de (ruta, stat) como scan_images, pero de una lista de rutas ya conocidas"""
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue  # Borrada o movida desde que se notificó
+        if stat.S_ISREG(st.st_mode):
+            yield path, st
+
+
+class Preloaded(io.BytesIO):
+    """
+    Contenido de un archivo ya leído en memoria, para pasarlo a open_image
+    en vez de su ruta. En los mensajes de error de Pillow aparece la ruta,
+    igual que si se hubiera abierto desde disco.
+    """
+
+    def __init__(self, data, path):
+        super().__init__(data)
+        self.path = path
+
+    def __repr__(self):
+        return repr(self.path)
+
+
+def open_image(path, max_pixels=None):
+    """
+    Image.open con un límite anti-"decompression bomb" propio.
+
+    Sin max_pixels se aplica el de Pillow (DecompressionBombError por encima
+    de 2 * Image.MAX_IMAGE_PIXELS). Con max_pixels ese es el límite exacto:
+    sirve para aceptar panorámicas y escaneos enormes a sabiendas.
+    """
+    if max_pixels is None:
+        return Image.open(path)
+    previous = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = None
+    try:
+        img = Image.open(path)
+    finally:
+        Image.MAX_IMAGE_PIXELS = previous
+    if img.width * img.height > max_pixels:
+        img.close()
+        raise Image.DecompressionBombError(
+            f"{img.width}x{img.height} supera el límite de {max_pixels / 1e6:g} MP")
+    return img
+
+
+def read_header(path, max_pixels=None):
+    """(ancho, alto, modo, formato) leyendo solo la cabecera: Image.open no decodifica"""
+    with open_image(path, max_pixels) as img:
+        return img.width, img.height, img.mode, img.format
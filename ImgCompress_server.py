@@ -0,0 +1,541 @@
+"""
+Servicio HTTP local de HYPER-SHRINK 3000.
+
+Para que otras herramientas usen el mismo motor que las interfaces sin
+lanzar una GUI ni la consola: se sube una imagen y se recibe comprimida.
+Solo usa la biblioteca estándar (asyncio) y escucha en 127.0.0.1 salvo que
+se pida otra cosa.
+
+    python ImgCompress_server.py [--port 8300] [--workers N] [--queue N]
+
+    curl --data-binary @foto.jpg -o foto_small.jpg "http://127.0.0.1:8300/compress?target_mb=2"
+
+Rutas:
+
+  POST /compress   cuerpo = la imagen tal cual (Content-Length o chunked).
+                   Parámetros: target_mb, format (uno de OUTPUT_FORMATS) y
+                   perceptual=1. Devuelve la imagen comprimida; calidad,
+                   escala y formato van en cabeceras X-Hypershrink-*.
+  GET  /metrics    JSON con la cola, lo que está en curso, contadores y
+                   percentiles de latencia (espera en cola, compresión, total).
+  GET  /health     {"status": "ok"}
+
+El cuerpo se vuelca por bloques a un archivo temporal (--spool) según llega
+y los procesos del pool lo leen de ahí con compress_file: en memoria solo
+hay un bloque por petición. Con la cola llena se responde 503 antes de leer
+el cuerpo (y sin mandar 100 Continue a quien lo espera).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from contextlib import suppress
+from dataclasses import dataclass, field
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import Image
+
+from ImgCompress_control import BatchControl, init_worker
+from ImgCompress_engine import (CODECS, CORRECTION_WINDOW, DEFAULT_FORMAT, DEFAULT_TARGET_MB, OUTPUT_FORMATS,
+                                compress_file, default_workers)
+from ImgCompress_quality import available as perceptual_available
+from ImgCompress_report import percentile
+from ImgCompress_scan import read_header
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8300
+DEFAULT_MAX_UPLOAD_MB = 256
+QUEUE_PER_WORKER = 4       # Peticiones admitidas por proceso si no se da --queue
+MAX_BATCH = 8              # Imágenes por tarea del pool como mucho
+CHUNK_SIZE = 256 * 1024    # Bloque de lectura del cuerpo y de escritura de la respuesta
+HEADER_LIMIT = 64 * 1024
+LATENCY_WINDOW = 1024      # Peticiones recientes de las que salen los percentiles de /metrics
+RETRY_AFTER_S = 1
+LINGER_S = 5               # Tras un error, cuánto se sigue leyendo (y tirando) el cuerpo que aún llega
+WARMUP_S = 0.2             # Lo que tarda cada tarea de arranque: mientras, ningún proceso queda libre
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 411: "Length Required",
+           413: "Payload Too Large", 415: "Unsupported Media Type", 422: "Unprocessable Entity",
+           431: "Request Header Fields Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HttpError(Exception):
+    """Error que se responde tal cual al cliente (y cierra la conexión: el cuerpo puede estar a medias)"""
+
+    def __init__(self, status, message, headers=()):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers
+
+
+@dataclass
+class Job:
+    args: tuple               # Argumentos de compress_file
+    future: asyncio.Future
+    accepted: float           # time.monotonic() al entrar en la cola
+
+
+def _compress_many(jobs):
+    """Se ejecuta en el pool: una tanda por tarea, así se paga un solo viaje entre procesos"""
+    return [compress_file(*args) for args in jobs]
+
+
+@dataclass
+class Metrics:
+    started: float = field(default_factory=time.monotonic)
+    counters: dict = field(default_factory=lambda: dict.fromkeys(
+        ("accepted", "rejected", "completed", "failed", "passthrough", "batches", "bytes_in", "bytes_out"), 0))
+    latency: dict = field(default_factory=lambda: {name: deque(maxlen=LATENCY_WINDOW)
+                                                   for name in ("queue", "compress", "total")})
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def observe(self, name, seconds):
+        self.latency[name].append(seconds)
+
+    def latency_ms(self):
+        out = {}
+        for name, values in self.latency.items():
+            values = list(values)
+            out[name] = {p: (None if v is None else round(v * 1000, 2)) for p, v in (
+                ("p50", percentile(values, 50)), ("p90", percentile(values, 90)),
+                ("p99", percentile(values, 99)), ("max", max(values) if values else None))}
+        return out
+
+
+class CompressionService:
+    """
+    Cola de peticiones delante de un ProcessPoolExecutor con compress_file.
+
+    El despachador manda trabajo en cuanto hay un proceso libre: con poca
+    carga cada petición va sola, y cuando se acumula cola cada tarea se lleva
+    una tanda (hasta MAX_BATCH) repartida entre los procesos libres. Las de
+    una tanda responden a la vez al terminarla.
+
+    `queue_size` limita las peticiones admitidas a la vez (recibiendo el
+    cuerpo, en cola o comprimiéndose); por encima se responde 503.
+    """
+
+    def __init__(self, workers=None, queue_size=None, target_mb=DEFAULT_TARGET_MB, output_format=DEFAULT_FORMAT,
+                 max_upload_mb=DEFAULT_MAX_UPLOAD_MB, spool=None, memory_mb=None, max_megapixels=None):
+        self.workers = workers or default_workers()
+        self.queue_size = queue_size or self.workers * QUEUE_PER_WORKER
+        self.target_mb = target_mb
+        self.output_format = output_format
+        self.max_upload = int(max_upload_mb * 1024 * 1024)
+        self.spool = spool
+        self.memory_budget = int(memory_mb * 1024 * 1024) if memory_mb else None
+        self.max_pixels = int(max_megapixels * 1e6) if max_megapixels else None
+
+        self.control = BatchControl()
+        self.metrics = Metrics()
+        self.queue = deque()   # Job pendientes de despachar
+        self.admitted = 0      # Peticiones de /compress entre la admisión y la respuesta
+        self.receiving = 0
+        self.in_flight = 0
+        self.free = self.workers
+        self.corrections = deque(maxlen=CORRECTION_WINDOW)
+        self.names = itertools.count()
+        self.tasks = set()
+        self.pool = self.server = self.dispatcher = self.wakeup = self.spool_dir = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        Image.init()  # Image.MIME solo se llena al cargar los plugins
+        self.spool_dir = tempfile.mkdtemp(prefix="hypershrink_", dir=self.spool)
+        self.pool = ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=(self.control,))
+        self._spawn_workers()
+        self.wakeup = asyncio.Event()
+        self.dispatcher = asyncio.create_task(self._dispatch())
+        self.server = await asyncio.start_server(self._handle, host, port, limit=HEADER_LIMIT)
+        return self.server
+
+    def _spawn_workers(self):
+        """
+        Crea ya todos los procesos del pool, antes de abrir el puerto. El
+        pool los bifurca en el primer submit: si eso pasara con el servidor
+        en marcha, heredarían el socket de escucha y los de los clientes (el
+        puerto seguiría ocupado al morir el principal y las conexiones
+        cerradas nunca terminarían de cerrarse). Cada tarea de arranque
+        espera un poco para que ningún proceso quede libre y se reutilice
+        (en Python < 3.11 se crea uno por submit sin proceso libre).
+        """
+        wait([self.pool.submit(time.sleep, WARMUP_S) for _ in range(self.workers)])
+
+    async def close(self):
+        """Deja de aceptar, cancela lo que queda (503) y espera a que paren los procesos"""
+        self.server.close()
+        self.control.cancel()
+        self.dispatcher.cancel()
+        while self.queue:
+            job = self.queue.popleft()
+            if not job.future.done():
+                job.future.set_exception(HttpError(503, "el servicio se está cerrando"))
+        await asyncio.to_thread(self.pool.shutdown, True, cancel_futures=True)
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self.server.wait_closed(), 5)
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+    # --- DESPACHO AL POOL ---
+
+    def correction(self):
+        """Mediana de las correcciones del predictor recientes, como en BatchRun"""
+        if not self.corrections:
+            return 1.0
+        return sorted(self.corrections)[len(self.corrections) // 2]
+
+    async def _dispatch(self):
+        while True:
+            while not (self.queue and self.free):
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            size = min(MAX_BATCH, -(-len(self.queue) // self.free))
+            batch = [self.queue.popleft() for _ in range(size)]
+            self.free -= 1
+            task = asyncio.create_task(self._run(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, batch):
+        now = time.monotonic()
+        for job in batch:
+            self.metrics.observe("queue", now - job.accepted)
+        self.metrics.count("batches")
+        self.in_flight += len(batch)
+        try:
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(self.pool, _compress_many, [job.args for job in batch])
+        except Exception as e:  # Pool roto o cerrándose
+            for job in batch:
+                if not job.future.done():
+                    job.future.set_exception(HttpError(503, f"pool no disponible: {e}"))
+        else:
+            for job, result in zip(batch, results):
+                if result.ok:
+                    self.corrections.append(result.correction)
+                if not job.future.done():
+                    job.future.set_result(result)
+        finally:
+            self.in_flight -= len(batch)
+            self.free += 1
+            self.wakeup.set()
+
+    # --- HTTP ---
+
+    async def _handle(self, reader, writer):
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await _read_head(reader)
+                    if request is None:
+                        break
+                    keep_alive = await self._route(*request, reader, writer)
+                except HttpError as e:
+                    await _respond_json(writer, e.status, {"error": str(e)}, e.headers, keep_alive=False)
+                    await _linger(reader, writer)
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # El cliente colgó a medias
+        except Exception as e:
+            with suppress(ConnectionError):
+                await _respond_json(writer, 500, {"error": str(e)}, keep_alive=False)
+        finally:
+            writer.close()
+            with suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _route(self, method, target, version, headers, reader, writer):
+        """Atiende una petición; devuelve si la conexión puede seguir abierta"""
+        url = urlsplit(target)
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+        routes = {"/compress": "POST", "/metrics": "GET", "/health": "GET"}
+        if url.path not in routes:
+            raise HttpError(404, f"ruta desconocida: {url.path}")
+        if method != routes[url.path]:
+            raise HttpError(405, f"{url.path} solo admite {routes[url.path]}", (("Allow", routes[url.path]),))
+        if url.path == "/health":
+            await _respond_json(writer, 200, {"status": "ok"}, keep_alive=keep_alive)
+        elif url.path == "/metrics":
+            await _respond_json(writer, 200, self.snapshot(), keep_alive=keep_alive)
+        else:
+            await self._compress(parse_qs(url.query), headers, reader, writer, keep_alive)
+        return keep_alive
+
+    def _options(self, query):
+        def param(name, default):
+            return query[name][-1] if name in query else default
+
+        try:
+            target_mb = float(param("target_mb", self.target_mb))
+        except ValueError:
+            raise HttpError(400, "target_mb debe ser un número") from None
+        if target_mb <= 0:
+            raise HttpError(400, "target_mb debe ser mayor que 0")
+        output_format = param("format", self.output_format)
+        if output_format not in OUTPUT_FORMATS:
+            raise HttpError(400, f"formato desconocido: {output_format} (admitidos: {', '.join(OUTPUT_FORMATS)})")
+        perceptual = param("perceptual", "0").lower() in ("1", "true", "yes")
+        if perceptual and not perceptual_available():
+            raise HttpError(400, "perceptual necesita NumPy en el servidor")
+        return int(target_mb * 1024 * 1024), output_format, perceptual
+
+    async def _compress(self, query, headers, reader, writer, keep_alive):
+        limit_bytes, output_format, perceptual = self._options(query)
+        chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+        length = headers.get("content-length")
+        if not chunked:
+            if length is None:
+                raise HttpError(411, "falta Content-Length")
+            if not length.isdigit():
+                raise HttpError(400, "Content-Length no válido")
+            length = int(length)
+            if length > self.max_upload:
+                raise HttpError(413, f"la imagen supera {self.max_upload} bytes")
+        if self.admitted >= self.queue_size:
+            self.metrics.count("rejected")
+            raise HttpError(503, "cola llena", (("Retry-After", str(RETRY_AFTER_S)),))
+
+        accepted = time.monotonic()
+        self.admitted += 1
+        self.metrics.count("accepted")
+        name = os.path.join(self.spool_dir, str(next(self.names)))
+        src, dst = f"{name}.in", None
+        try:
+            if headers.get("expect", "").lower() == "100-continue":
+                writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            self.receiving += 1
+            try:
+                with open(src, "wb") as f:
+                    if chunked:
+                        size = await _read_chunked(reader, f, self.max_upload)
+                    else:
+                        size = await _copy(reader, f, length)
+            finally:
+                self.receiving -= 1
+            self.metrics.count("bytes_in", size)
+
+            if size <= limit_bytes:
+                # Ya es pequeña: como en run_batch, se devuelve sin tocar
+                try:
+                    fmt = read_header(src, self.max_pixels)[3]
+                except (OSError, Image.DecompressionBombError) as e:
+                    raise HttpError(415, f"no es una imagen válida: {str(e).replace(src, 'upload')}") from None
+                self.metrics.count("passthrough")
+                await _respond_file(writer, src, Image.MIME.get(fmt, "application/octet-stream"),
+                                    (("X-Hypershrink-Compressed", "0"),), keep_alive)
+                self.metrics.count("bytes_out", size)
+                self.metrics.observe("total", time.monotonic() - accepted)
+                return
+
+            job = Job((src, f"{name}.out", limit_bytes, None, False, self.memory_budget, self.max_pixels,
+                       output_format, self.correction(), perceptual),
+                      asyncio.get_running_loop().create_future(), time.monotonic())
+            self.queue.append(job)
+            self.wakeup.set()
+            result = await job.future
+            dst = result.dst
+            if result.cancelled:
+                raise HttpError(503, "el servicio se está cerrando")
+            if not result.ok:
+                self.metrics.count("failed")
+                # El mensaje de Pillow lleva la ruta del temporal: al cliente no le dice nada
+                raise HttpError(422, result.error.replace(src, "upload") if result.error
+                                else "no se puede dejar por debajo del límite")
+
+            self.metrics.count("completed")
+            self.metrics.observe("compress", result.wall_s)
+            codec = CODECS[result.codec]
+            waited = time.monotonic() - accepted - result.wall_s
+            await _respond_file(writer, dst, Image.MIME.get(codec.format, "application/octet-stream"), (
+                ("X-Hypershrink-Compressed", "1"),
+                ("X-Hypershrink-Codec", codec.name),
+                ("X-Hypershrink-Quality", str(result.quality)),
+                ("X-Hypershrink-Scale", f"{result.scale:.4f}"),
+                ("X-Hypershrink-Original-Bytes", str(size)),
+                ("Server-Timing", f"queue;dur={waited * 1000:.1f}, compress;dur={result.wall_s * 1000:.1f}"),
+            ), keep_alive)
+            self.metrics.count("bytes_out", result.size)
+            self.metrics.observe("total", time.monotonic() - accepted)
+        finally:
+            self.admitted -= 1
+            for path in (src, dst):
+                if path:
+                    with suppress(OSError):
+                        os.remove(path)
+
+    def snapshot(self):
+        """Estado para /metrics"""
+        return {
+            "uptime_s": round(time.monotonic() - self.metrics.started, 1),
+            "workers": self.workers,
+            "queue": {"depth": len(self.queue), "receiving": self.receiving, "in_flight": self.in_flight,
+                      "admitted": self.admitted, "limit": self.queue_size, "free_workers": self.free},
+            "counters": dict(self.metrics.counters),
+            "latency_ms": self.metrics.latency_ms(),
+        }
+
+
+# --- PROTOCOLO (lo justo de HTTP/1.1) ---
+
+async def _read_head(reader):
+    """(método, ruta, versión, cabeceras en minúsculas), o None si el cliente cerró entre peticiones"""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None
+        raise
+    except asyncio.LimitOverrunError:
+        raise HttpError(431, "cabeceras demasiado grandes") from None
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ")
+    except ValueError:
+        raise HttpError(400, "línea de petición no válida") from None
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    return method, target, version, headers
+
+
+async def _copy(reader, f, length):
+    """Vuelca `length` bytes del cuerpo a f por bloques y devuelve cuántos fueron"""
+    remaining = length
+    while remaining:
+        chunk = await reader.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise asyncio.IncompleteReadError(b"", remaining)
+        f.write(chunk)
+        remaining -= len(chunk)
+    return length
+
+
+async def _read_chunked(reader, f, max_bytes):
+    """Como _copy pero con Transfer-Encoding: chunked"""
+    total = 0
+    while True:
+        line = await reader.readline()
+        try:
+            size = int(line.split(b";")[0].strip(), 16)
+        except ValueError:
+            raise HttpError(400, "bloque chunked no válido") from None
+        if size == 0:
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass  # Cabeceras finales: no se usan
+            return total
+        total += size
+        if total > max_bytes:
+            raise HttpError(413, f"la imagen supera {max_bytes} bytes")
+        await _copy(reader, f, size)
+        await reader.readexactly(2)
+
+
+async def _linger(reader, writer):
+    """
+    Cierre diferido tras responder a un cuerpo sin leer: si se cerrase ya, el
+    cliente que sigue enviando recibiría un RST y nunca vería la respuesta
+    (el 503 de la cola llena). Se tira lo que llegue hasta que cuelgue.
+    """
+    with suppress(ConnectionError, OSError):
+        if writer.can_write_eof():
+            writer.write_eof()
+    async def discard():
+        while await reader.read(CHUNK_SIZE):
+            pass
+
+    with suppress(asyncio.TimeoutError, ConnectionError):
+        await asyncio.wait_for(discard(), LINGER_S)
+
+
+def _head(status, headers, length, keep_alive):
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", f"Content-Length: {length}",
+             f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    lines.extend(f"{name}: {value}" for name, value in headers)
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def _respond_json(writer, status, payload, headers=(), keep_alive=True):
+    body = json.dumps(payload).encode("utf-8")
+    writer.write(_head(status, (("Content-Type", "application/json"), *headers), len(body), keep_alive) + body)
+    await writer.drain()
+
+
+async def _respond_file(writer, path, content_type, headers, keep_alive):
+    """Cabeceras y después el archivo con sendfile (sin pasar por Python si el sistema lo permite)"""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        writer.write(_head(200, (("Content-Type", content_type), *headers), size, keep_alive))
+        await writer.drain()
+        await asyncio.get_running_loop().sendfile(writer.transport, f)
+
+
+# --- CONSOLA ---
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="ImgCompress_server",
+                                     description="Servicio HTTP local de compresión de HYPER-SHRINK 3000.")
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help=f"dirección en la que escuchar (por defecto {DEFAULT_HOST}, solo esta máquina)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"puerto (por defecto {DEFAULT_PORT})")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help=f"procesos de compresión (por defecto {default_workers()}, uno por núcleo)")
+    parser.add_argument("--queue", type=int, default=None, metavar="N",
+                        help=f"peticiones admitidas a la vez antes de responder 503 "
+                             f"(por defecto {QUEUE_PER_WORKER} por proceso)")
+    parser.add_argument("-t", "--target-mb", type=float, default=DEFAULT_TARGET_MB,
+                        help=f"límite si la petición no trae target_mb (por defecto {DEFAULT_TARGET_MB})")
+    parser.add_argument("-f", "--format", choices=OUTPUT_FORMATS, default=DEFAULT_FORMAT,
+                        help=f"formato si la petición no trae format (por defecto {DEFAULT_FORMAT})")
+    parser.add_argument("--max-upload-mb", type=float, default=DEFAULT_MAX_UPLOAD_MB, metavar="MB",
+                        help=f"tamaño máximo de una subida (por defecto {DEFAULT_MAX_UPLOAD_MB})")
+    parser.add_argument("--spool", default=None, metavar="DIR",
+                        help="carpeta para las subidas en curso (por defecto la temporal del sistema; "
+                             "/dev/shm las deja en RAM)")
+    parser.add_argument("--memory-mb", type=float, default=None, metavar="MB",
+                        help="presupuesto de memoria por proceso (ver ImgCompress_cli)")
+    parser.add_argument("--max-megapixels", type=float, default=None, metavar="MP",
+                        help="rechazar imágenes de más megapíxeles (por defecto el límite de Pillow)")
+    return parser
+
+
+async def serve(args):
+    service = CompressionService(args.workers, args.queue, args.target_mb, args.format, args.max_upload_mb,
+                                 args.spool, args.memory_mb, args.max_megapixels)
+    await service.start(args.host, args.port)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError, AttributeError):  # Windows: Ctrl+C llega como KeyboardInterrupt
+            loop.add_signal_handler(signum, stop.set)
+    print(f">> LISTENING ON http://{args.host}:{args.port} ({service.workers} WORKERS, "
+          f"QUEUE {service.queue_size}). CTRL+C TO STOP")
+    try:
+        await stop.wait()
+    finally:
+        print(">> SHUTTING DOWN", file=sys.stderr)
+        await service.close()
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    with suppress(KeyboardInterrupt):
+        asyncio.run(serve(args))
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,249 @@
+"""
+Modo vigilancia de HYPER-SHRINK 3000: comprime las imágenes según llegan.
+
+Tras una pasada inicial (que el manifiesto hace casi gratuita si la carpeta
+ya estaba procesada), la carpeta se vigila con inotify en Linux o, si no
+está disponible, comparando su listado cada pocos segundos. Un archivo
+nuevo o modificado solo se comprime cuando lleva `settle_s` segundos sin
+cambiar de tamaño ni de fecha: así no se lee una copia a medias.
+
+    for event in watch_batch(folder, 16):
+        ...  # Los mismos eventos que run_batch, pasada a pasada
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from ImgCompress_dedup import DEFAULT_DEDUP
+from ImgCompress_engine import (DEFAULT_FORMAT, DEFAULT_OUTPUT_NAME, DEFAULT_PREFETCH, DEFAULT_SUFFIX,
+                                DEFAULT_TARGET_MB, BatchRun, default_workers)
+from ImgCompress_scan import accepts, scan_images
+
+DEFAULT_SETTLE_S = 2.0  # Segundos sin cambios para dar un archivo por terminado de escribir
+DEFAULT_POLL_S = 2.0    # Intervalo de sondeo cuando no hay inotify
+
+# Constantes de <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len (+ nombre de len bytes)
+
+
+def _skipped(path, skip_dirs):
+    path = os.path.abspath(path)
+    return any(path == d or path.startswith(d + os.sep) for d in skip_dirs)
+
+
+class PollingWatcher:
+    """Compara (tamaño, fecha) de las imágenes entre dos recorridos; vale en cualquier sistema"""
+
+    backend = "polling"
+
+    def __init__(self, folder, recursive=False, skip_dirs=(), poll_s=DEFAULT_POLL_S):
+        self.folder = folder
+        self.recursive = recursive
+        self.skip_dirs = list(skip_dirs)
+        self.poll_s = poll_s
+        self.next_poll = time.monotonic() + poll_s
+        self.seen = self._snapshot()
+
+    def _snapshot(self):
+        return {path: (st.st_size, st.st_mtime_ns)
+                for path, st in scan_images(self.folder, self.recursive, skip_dirs=self.skip_dirs)}
+
+    def changes(self, timeout):
+        """Rutas nuevas o modificadas desde la última llamada (espera como mucho timeout)"""
+        wait = self.next_poll - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(wait, 0))
+        self.next_poll = time.monotonic() + self.poll_s
+        current = self._snapshot()
+        changed = [path for path, sig in current.items() if self.seen.get(path) != sig]
+        self.seen = current
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    inotify del kernel (Linux) mediante ctypes, sin dependencias. Con
+    `recursive` vigila también las subcarpetas, incluidas las que se creen
+    después; si la cola del kernel se desborda se relista todo.
+    """
+
+    backend = "inotify"
+
+    def __init__(self, folder, recursive=False, skip_dirs=()):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self.folder = folder
+        self.recursive = recursive
+        self.skip_dirs = [os.path.abspath(d) for d in skip_dirs]
+        self.dirs = {}  # descriptor de vigilancia -> carpeta
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        try:
+            if not self._add(folder):
+                err = ctypes.get_errno()
+                raise OSError(err, os.strerror(err), folder)
+            if recursive:
+                self._add_tree(folder)
+        except Exception:
+            os.close(self.fd)
+            raise
+
+    def _add(self, path):
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            return False  # Carpeta borrada o límite de vigilancias: se ve en el siguiente relistado
+        self.dirs[wd] = path
+        return True
+
+    def _add_tree(self, root):
+        """Vigila las subcarpetas de root y devuelve los archivos que ya contienen"""
+        found = []
+        for current, subdirs, files in os.walk(root):
+            subdirs[:] = [d for d in subdirs if not _skipped(os.path.join(current, d), self.skip_dirs)]
+            for d in subdirs:
+                self._add(os.path.join(current, d))
+            found.extend(os.path.join(current, f) for f in files)
+        return found
+
+    def changes(self, timeout):
+        """Rutas creadas, movidas aquí o escritas desde la última llamada (espera como mucho timeout)"""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        changed = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Se han perdido eventos: se relista todo y el manifiesto descarta lo ya hecho
+                changed.extend(path for path, _ in scan_images(self.folder, self.recursive,
+                                                               skip_dirs=self.skip_dirs))
+                continue
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)  # La carpeta ya no existe
+                continue
+            parent = self.dirs.get(wd)
+            if parent is None:
+                continue
+            path = os.path.join(parent, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if (self.recursive and mask & (IN_CREATE | IN_MOVED_TO)
+                        and not _skipped(path, self.skip_dirs) and self._add(path)):
+                    # Lo copiado dentro antes de empezar a vigilarla no generaría eventos
+                    changed.extend(self._add_tree(path))
+                continue
+            changed.append(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def make_watcher(folder, recursive=False, skip_dirs=(), poll_s=DEFAULT_POLL_S, polling=False):
+    """InotifyWatcher si el sistema lo permite; si no (o con polling), PollingWatcher"""
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(folder, recursive, skip_dirs)
+        except (OSError, AttributeError):  # Sin libc con inotify, o límite de instancias
+            pass
+    return PollingWatcher(folder, recursive, skip_dirs, poll_s)
+
+
+class Debouncer:
+    """Retiene cada ruta hasta que su (tamaño, fecha) no cambia durante settle_s segundos"""
+
+    def __init__(self, settle_s=DEFAULT_SETTLE_S):
+        self.settle_s = settle_s
+        self.pending = {}  # ruta -> (firma, instante del último cambio)
+
+    def touch(self, path, now):
+        self.pending.setdefault(path, (None, now))
+
+    def ready(self, now):
+        """Rutas estables ya listas para comprimir; las borradas se olvidan"""
+        done = []
+        for path, (signature, since) in list(self.pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            if current != signature:
+                self.pending[path] = (current, now)
+            elif now - since >= self.settle_s:
+                del self.pending[path]
+                done.append(path)
+        return done
+
+
+def watch_batch(folder, target_mb=DEFAULT_TARGET_MB, output_folder=None, suffix=DEFAULT_SUFFIX,
+                workers=None, recursive=False, include=(), exclude=(), mirror=False, event_log=None,
+                fsync_every=0, memory_mb=None, max_megapixels=None, output_format=DEFAULT_FORMAT, control=None,
+                settle_s=DEFAULT_SETTLE_S, poll_s=DEFAULT_POLL_S, polling=False, dedup=DEFAULT_DEDUP,
+                perceptual=False, prefetch=DEFAULT_PREFETCH):
+    """
+    Generador de eventos que no termina hasta que se cancela `control`.
+
+    Primero hace una pasada normal sobre toda la carpeta; después entrega un
+    evento watching (folder, backend: "inotify" o "polling") y, por cada
+    tanda de archivos estables, los eventos de una pasada de run_batch
+    limitada a esas rutas (start ... end). Siempre usa el manifiesto: es lo
+    que evita recomprimir lo que no ha cambiado.
+    """
+    output_folder = output_folder or os.path.join(folder, DEFAULT_OUTPUT_NAME)
+    options = dict(folder=folder, target_mb=target_mb, output_folder=output_folder, suffix=suffix,
+                   recursive=recursive, use_manifest=True, include=include, exclude=exclude, mirror=mirror,
+                   plan=True, event_log=event_log, fsync_every=fsync_every, memory_mb=memory_mb,
+                   max_megapixels=max_megapixels, output_format=output_format, control=control, dedup=dedup,
+                   perceptual=perceptual, prefetch=prefetch)
+
+    # Se empieza a vigilar antes de la pasada inicial: lo que llegue durante ella no se pierde
+    os.makedirs(output_folder, exist_ok=True)
+    watcher = make_watcher(folder, recursive, [output_folder], poll_s, polling)
+    debouncer = Debouncer(settle_s)
+    try:
+        yield from BatchRun(workers=workers, **options).run()
+        yield {"type": "watching", "folder": folder, "backend": watcher.backend}
+
+        while not (control is not None and control.cancelled):
+            now = time.monotonic()
+            for path in watcher.changes(timeout=min(settle_s, 1.0)):
+                rel_path = os.path.relpath(path, folder).replace(os.sep, "/")
+                if accepts(rel_path, recursive, include, exclude):
+                    debouncer.touch(path, now)
+            if control is not None and control.paused:
+                continue  # Lo pendiente espera; los cambios se siguen anotando
+            ready = debouncer.ready(time.monotonic())
+            if ready:
+                # Con una o dos imágenes no merece la pena arrancar un pool entero
+                yield from BatchRun(workers=min(workers or default_workers(), len(ready)),
+                                    paths=sorted(ready), **options).run()
+    finally:
+        watcher.close()